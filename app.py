@@ -1,18 +1,86 @@
 import streamlit as st
-from PIL import Image
 import random
-import folium
-from folium.plugins import TimestampedGeoJson
 import os
 import time
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import math
+import json
+import bisect
+from datetime import datetime, timedelta
+import numpy as np
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import RerunData, add_script_run_ctx, get_script_run_ctx
+from simplify_geojson import load_boundary
+from spatial import BoundaryIndex, PointIndex, random_points_on_land
+from topology import load_topology
+from tile_cache import start_tile_server
+from event_log import EventLog
+from stage_timing import NO_TIMING, StageTimer, StageTimings, start_metrics_server
+from telemetry import METRICS, VIEWS, TelemetryCollector, TelemetryStore, create_source
+from entropy_scanner import EncryptionDetector
+from file_scanner import FileStorageScanner, storage_roots_from_env, to_percentages
+from render_cache import SYSTEM_STATUSES, RenderCache, all_states, state_fingerprint, state_seed
+from scenario_state import ATTACK_SERVER_FOUND, create_state, default_state
 
 BACKGROUND_COLOR = 'black'
 COLOR = 'white'
+MAP_ZOOM = 10
+# Upper bound for cached map HTML; all 54 states of both maps fit comfortably
+MAP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Set ZELONIA_PREWARM_MAPS=1 to render every scenario state when the server starts
+PREWARM_MAPS = os.environ.get("ZELONIA_PREWARM_MAPS", "0") == "1"
+# Device classes on the devices map, each drawn with a shared icon
+DEVICE_CLASSES = [
+    {"icon": "data/Images/mobile-phone.png", "icon_size": (20, 20), "color": '#1f77b4'},
+    {"icon": "data/Images/monitor.png", "icon_size": (20, 20), "color": '#ff7f0e'},
+    {"icon": "data/Images/laptop.png", "icon_size": (20, 20), "color": '#2ca02c'},
+]
+# Where health telemetry comes from: "stub", "file:<path>" or "udp:<host>:<port>"
+TELEMETRY_SOURCE = os.environ.get("ZELONIA_TELEMETRY", "stub")
+TELEMETRY_INTERVAL = 1.0  # Seconds between telemetry polls
+TELEMETRY_REFRESH = 10  # Seconds before a health panel re-reads its telemetry
+PANEL_CACHE_ENTRIES = 64  # Health panels and pie charts kept for all sessions
+STATE_POLL_INTERVAL = 1.0  # Seconds between each session's checks for scenario changes
+FILE_SCAN_WORKERS = 8
+FILE_SCAN_INTERVAL = 60.0  # Seconds between file storage re-scans
+# Seconds between full re-scans, which also find files edited in place
+FILE_FULL_SCAN_INTERVAL = float(os.environ.get("ZELONIA_FULL_SCAN_INTERVAL", 3600))
+# Scanned files are checked for encryption by sampling this many bytes of each
+DETECT_ENCRYPTION = os.environ.get("ZELONIA_DETECT_ENCRYPTION", "1") == "1"
+ENTROPY_SAMPLE_BYTES = int(os.environ.get("ZELONIA_ENTROPY_SAMPLE_BYTES", 64 * 1024))
+ENTROPY_WORKERS = int(os.environ.get("ZELONIA_ENTROPY_WORKERS", 2))  # Processes checking samples
+# Offline basemap: an MBTiles file made with `python tile_cache.py prefetch`.
+# When it exists it is served locally and both maps use it instead of the CDN.
+TILE_FILE = os.environ.get("ZELONIA_TILES", "data/tiles.mbtiles")
+TILE_PORT = int(os.environ.get("ZELONIA_TILE_PORT", 8502))
+# Address the viewers' browsers use to reach the tile server, e.g.
+# http://10.0.0.5:8502/tiles/{z}/{x}/{y}.png. Required when TILE_FILE exists:
+# there is no default, as localhost only works in a browser on this machine.
+TILE_URL = os.environ.get("ZELONIA_TILE_URL")
+TILE_MAX_NATIVE_ZOOM = int(os.environ.get("ZELONIA_TILE_MAX_ZOOM", 12))
+# Where the scenario state lives: "memory" (this process only) or
+# "sqlite:<path>" to share it between several Streamlit processes
+STATE_BACKEND = os.environ.get("ZELONIA_STATE", "memory")
+# Every admin change is appended here so the exercise can be replayed
+EVENT_LOG_FILE = os.environ.get("ZELONIA_EVENT_LOG", "data/events.jsonl")
+REPLAY_STEP_SECONDS = 60  # Spacing of the replay slider between changes
+STATUS_COLORS = {"Online": 'lightgreen', "Isolated": 'lightgray', "Offline": 'red'}
+STARTUP_LOG_FILE = os.environ.get("ZELONIA_STARTUP_LOG", "data/startup.jsonl")
+# Set by serve.py when it starts, so start-up times count from process start
+PROCESS_START = float(os.environ.get("ZELONIA_PROCESS_START", 0)) or None
+# Time each stage of the page for the admin performance panel and /metrics
+PROFILE_STAGES = os.environ.get("ZELONIA_PROFILE", "0") == "1"
+METRICS_PORT = int(os.environ.get("ZELONIA_METRICS_PORT", 9502))
+HEALTH_BAR_COLOR = '#ff4b4b'
+HEALTH_BAR_TRACK_COLOR = '#262730'
+# Vega-Lite spec of the health trend chart; its samples are passed separately
+TREND_CHART_SPEC = {
+    "mark": {"type": "line"},
+    "height": 150,
+    "encoding": {"x": {"field": "Time", "type": "temporal", "title": None},
+                 "y": {"field": "System Health", "type": "quantitative"}},
+}
 
 
 st.set_page_config(
@@ -23,31 +91,213 @@ st.set_page_config(
 
 
 
-# Function to get admin controls
-@st.cache_resource()
-def get_admin_controls():
-    return {
-        "Navigation": "Online",
-        "Weather": "Online",
-        "Corporate": "Online"
-    }
-
-# Function to get admin inputs
-@st.cache_resource()
-def get_admin_inputs():
-    return {
-        "num_affected_points": {
-            'server1': 'Online',
-            'server2': 'Online',
-            'server3': 'Online'
-        },
-        "attack_server_found": False
-    }
-
-# Function to simulate scanning process
-@st.experimental_fragment
-def scan_file_storage(system_name, status):
-    # Simulate scanning process
+# Function to get a boundary simplified for the map zoom, parsed once per server
+@st.cache_resource(show_spinner=False)
+def get_boundary(name, zoom):
+    return load_boundary(name, zoom)
+
+# Function to get the stage timer shared by every session. When enabled, the
+# process-wide histograms are also served at /metrics for Prometheus.
+@st.cache_resource(show_spinner=False)
+def get_stage_timer():
+    timer = StageTimer(PROFILE_STAGES)
+    if PROFILE_STAGES:
+        try:
+            start_metrics_server(timer.process, port=METRICS_PORT)
+        except OSError as e:
+            print(f"Metrics server not started on port {METRICS_PORT}: {e}")
+    return timer
+
+timer = get_stage_timer()
+
+# Function to record the stages of this script run into the session's own
+# histograms as well
+def session_stages():
+    if not timer.enabled:
+        return NO_TIMING
+    return timer.session(st.session_state.setdefault("stage_timings", StageTimings()))
+
+# Function to start the local tile server once per server process, if there
+# is a tile file. If the port is taken (e.g. by `python tile_cache.py serve`)
+# that server is used.
+@st.cache_resource(show_spinner=False)
+def get_tile_server():
+    if not os.path.exists(TILE_FILE):
+        return None
+    if not TILE_URL:
+        raise ValueError(f"{TILE_FILE} exists, so set ZELONIA_TILE_URL to the address the viewers' browsers reach "
+                         f"the tile server at, e.g. http://<server address>:{TILE_PORT}/tiles/{{z}}/{{x}}/{{y}}.png")
+    try:
+        return start_tile_server(TILE_FILE, port=TILE_PORT)
+    except OSError as e:
+        print(f"Tile server not started, using the one on port {TILE_PORT}: {e}")
+        return None
+
+# Function to create a map on the local basemap if there is a tile file, else
+# on the CARTO dark basemap. Past the deepest prefetched zoom Leaflet scales
+# tiles up.
+def create_base_map(location):
+    import folium
+
+    if not os.path.exists(TILE_FILE):
+        return folium.Map(location=location, zoom_start=MAP_ZOOM, tiles='Cartodb dark_matter')
+    get_tile_server()
+    m = folium.Map(location=location, zoom_start=MAP_ZOOM, tiles=None)
+    folium.TileLayer(TILE_URL, attr="Zelonia basemap", max_native_zoom=TILE_MAX_NATIVE_ZOOM, max_zoom=18).add_to(m)
+    return m
+
+# Function to get the sites of every system, loaded once per server
+@st.cache_resource(show_spinner=False)
+def get_topology():
+    return load_topology()
+
+# Function to get the point-in-polygon index of Zelonia's full-resolution
+# boundary, used to keep devices on land
+@st.cache_resource(show_spinner=False)
+def get_land_index():
+    return BoundaryIndex(load_boundary("Zelonia"))
+
+# Function to get the nearest-neighbour index over every HQ and server, with
+# the index into the topology's systems of the system each point belongs to
+@st.cache_resource(show_spinner=False)
+def get_site_index():
+    topology = get_topology()
+    sites = [(number, site) for number, system in enumerate(topology.systems)
+             for site in (system.headquarters,) + system.servers]
+    return PointIndex([site for _, site in sites]), np.array([number for number, _ in sites])
+
+# Function to get the shared cache of rendered map HTML
+@st.cache_resource(show_spinner=False)
+def get_render_cache():
+    cache = RenderCache(MAP_CACHE_MAX_BYTES)
+    if PREWARM_MAPS:
+        thread = threading.Thread(target=prewarm_render_cache, args=(cache,), daemon=True)
+        add_script_run_ctx(thread, get_script_run_ctx())
+        thread.start()
+    return cache
+
+# Function to render both maps for every scenario state ahead of the first viewer.
+# It runs on a background thread with the script context of the run that created
+# the cache, so the cache_resource getters it calls work as in a session.
+def prewarm_render_cache(cache):
+    for admin_controls, attack_server_found in all_states(get_topology().system_names):
+        fingerprint = state_fingerprint(admin_controls, attack_server_found)
+        cache.get_or_render(("servers", fingerprint), lambda: build_server_map(admin_controls, attack_server_found))
+        cache.get_or_render(("devices", fingerprint), lambda: build_device_map(admin_controls, attack_server_found))
+
+# Function to get the telemetry collector; it keeps polling in the background
+@st.cache_resource(show_spinner=False)
+def get_telemetry_collector():
+    state = get_scenario_state()
+    system_names = get_topology().system_names
+    source = create_source(TELEMETRY_SOURCE, lambda: {name: state.get(name) for name in system_names})
+    collector = TelemetryCollector(TelemetryStore(system_names), source, TELEMETRY_INTERVAL)
+    collector.poll_once()
+    if TELEMETRY_SOURCE == "stub":
+        # Stub values follow the statuses, so sample as soon as they change
+        state.subscribe(lambda version, changed: collector.poll_once())
+    collector.start()
+    return collector
+
+# Function to get the event log. A new log starts with the current state;
+# the admin's changes are appended to it as they are made.
+@st.cache_resource(show_spinner=False)
+def get_event_log():
+    event_log = EventLog(EVENT_LOG_FILE)
+    event_log.seed_if_empty(time.time(), get_scenario_state().snapshot()[1])
+    return event_log
+
+# Function to get the background file storage scanner, or None when no
+# storage roots are configured
+@st.cache_resource(show_spinner=False)
+def get_file_scanner():
+    roots = storage_roots_from_env(get_topology().system_names)
+    if not roots:
+        return None
+    detector = EncryptionDetector(ENTROPY_WORKERS, ENTROPY_SAMPLE_BYTES) if DETECT_ENCRYPTION else None
+    scanner = FileStorageScanner(roots, FILE_SCAN_WORKERS, FILE_SCAN_INTERVAL, detector, FILE_FULL_SCAN_INTERVAL)
+    scanner.start()
+    return scanner
+
+# Function to get the shared scenario state (system statuses and attack flag)
+@st.cache_resource(show_spinner=False)
+def get_scenario_state():
+    return create_state(STATE_BACKEND, default_state(get_topology().system_names))
+
+# Function to get the start-up report shared by every session: the warm-up
+# stage times, the cold-start time (process start to warmed up) and the
+# first-paint time (the first session's page run)
+@st.cache_resource(show_spinner=False)
+def get_startup_report():
+    return {"process_start": PROCESS_START, "warm_up": None, "cold_start": None, "first_paint": None}
+
+# Function to append the start-up report to the start-up log
+def write_startup_report(report):
+    with open(STARTUP_LOG_FILE, 'a') as f:
+        f.write(json.dumps({"t": time.time(), **report}) + "\n")
+
+# Function to load everything the first page needs before the server accepts
+# sessions: the heavy imports, topology, boundaries, land and site indexes, device icons,
+# both maps of the current state and the background services
+def warm_up():
+    stages = {}
+
+    def stage(name, function):
+        start = time.perf_counter()
+        function()
+        stages[name] = round(time.perf_counter() - start, 3)
+
+    def import_libraries():
+        import folium.plugins  # noqa: F401
+        import pandas  # noqa: F401
+        import plotly.graph_objects  # noqa: F401
+
+    def load_icons():
+        from device_layer import icon_url
+        for device_class in DEVICE_CLASSES:
+            icon_url(device_class["icon"])
+
+    def render_maps():
+        _, scenario = get_scenario_state().snapshot()
+        admin_controls = {name: scenario[name] for name in get_topology().system_names}
+        create_new_map(admin_controls, scenario[ATTACK_SERVER_FOUND])
+        create_device_map(admin_controls, scenario[ATTACK_SERVER_FOUND])
+
+    def start_services():
+        get_telemetry_collector()
+        get_event_log()
+        get_file_scanner()
+        get_tile_server()
+
+    stage("imports", import_libraries)
+    stage("topology", get_topology)
+    stage("boundaries", lambda: [get_boundary(name, MAP_ZOOM) for name in ("Zelonia", "Putonia")])
+    stage("land_index", get_land_index)
+    stage("site_index", get_site_index)
+    stage("icons", load_icons)
+    stage("services", start_services)
+    stage("maps", render_maps)
+
+    report = get_startup_report()
+    report["warm_up"] = stages
+    if PROCESS_START:
+        report["cold_start"] = round(time.time() - PROCESS_START, 3)
+    write_startup_report(report)
+    return report
+
+# Function to record how long the first session's page took to draw
+def record_first_paint(seconds):
+    report = get_startup_report()
+    if report["first_paint"] is not None:
+        return
+    report["first_paint"] = round(seconds, 3)
+    if PROCESS_START:
+        report["first_paint_since_start"] = round(time.time() - PROCESS_START, 3)
+    write_startup_report(report)
+
+# Function to get the file extension breakdown of a system's storage. Uses the
+# latest background scan when storage roots are configured, else sample figures.
+def scan_file_storage(system_name, status, scanner=None):
     scanned_results = {}
 
     # Define file extension percentages for each system
@@ -56,19 +306,22 @@ def scan_file_storage(system_name, status):
         "Weather": {"json": 40, "csv": 30, "txt": 20, "xml": 5, "grib": 3, "dat": 2},
         "Corporate": {"eml": 50, "pdf": 30, "xlsx": 10, "docx": 5, "csv": 3, "json": 2}
     }
+    snapshot = scanner.latest(system_name) if scanner else None
 
-    if status == "Online":
-        # For online systems, return the predefined file extension percentages
-        scanned_results = file_extensions.get(system_name, {})
-        print(scanned_results)
+    if status == "Isolated":
+        # Isolated systems can't be scanned
+        scanned_results = {"Undefined":100}
+
+    elif snapshot and snapshot["files"]:
+        # Real scan: encrypted files already show up as SPIKE
+        scanned_results = to_percentages(snapshot["by_count"])
 
-    elif status == "Isolated":
+    elif status == "Online":
         # For online systems, return the predefined file extension percentages
-        scanned_results = {"Undefined":100}
-        print(scanned_results)
+        scanned_results = file_extensions.get(system_name, {})
 
     else:
-        # For offline systems, simulate SPIKE percentage between 90 and 97
+        # For offline systems, simulate SPIKE percentage between 80 and 90
         spike_percentage = random.randint(80, 90)
         scanned_results["SPIKE"] = spike_percentage
 
@@ -80,94 +333,81 @@ def scan_file_storage(system_name, status):
 
     return scanned_results
 
-def generate_points_around_coordinate(coordinate, num_points, max_offset_degrees):
+# Function to scatter points around a coordinate. With a land index the points
+# are drawn in one batch and the ones in the sea are thrown away.
+def generate_points_around_coordinate(coordinate, num_points, max_offset_degrees, rng=random, land=None):
+    if land is not None:
+        generator = np.random.default_rng(rng.getrandbits(64))
+        points = random_points_on_land(land, np.asarray(coordinate), num_points, max_offset_degrees, generator)
+        return [tuple(point) for point in points.tolist()]
     points = []
     for _ in range(num_points):
-        lat = coordinate[0] + random.uniform(-max_offset_degrees, max_offset_degrees)
-        lon = coordinate[1] + random.uniform(-max_offset_degrees, max_offset_degrees)
+        lat = coordinate[0] + rng.uniform(-max_offset_degrees, max_offset_degrees)
+        lon = coordinate[1] + rng.uniform(-max_offset_degrees, max_offset_degrees)
         points.append((lat, lon))
     return points
 
-# Function to display pie charts for file extensions
-def display_pie_charts(system_name, results):
-    st.subheader(f"File Extensions for {system_name}")
+# Function to build the pie chart of file extensions (no Streamlit calls, so
+# the figure can be built once and shown on every rerun)
+def build_pie_chart(results):
+    import plotly.graph_objects as go
 
     # Create a list of colors for the pie chart
     colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
     results = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
 
-
     # Create a Pie chart using Plotly
-    fig = go.Figure(data=[go.Pie(labels=list(results.keys()), values=list(results.values()), textposition="inside", textinfo='label+percent', marker=dict(colors=colors))])
-    
-    
+    return go.Figure(data=[go.Pie(labels=list(results.keys()), values=list(results.values()), textposition="inside", textinfo='label+percent', marker=dict(colors=colors))])
+
+# Function to display pie charts for file extensions
+def display_pie_charts(system_name, figure):
+    st.subheader(f"File Extensions for {system_name}")
+
     # Render the Plotly chart
-    st.plotly_chart(fig,use_container_width=True)
+    st.plotly_chart(figure,use_container_width=True)
 
-@st.experimental_fragment
 def create_new_map(num_affected_points, show_attack_server):
+    key = ("servers", state_fingerprint(num_affected_points, show_attack_server))
+    with timer.stage("server_map"):
+        return get_render_cache().get_or_render(key, lambda: build_server_map(num_affected_points, show_attack_server))
+
+# Function to build the servers map HTML for one scenario state
+@timer.timed("server_map_build")
+def build_server_map(num_affected_points, show_attack_server):
+    import folium
+
+    topology = get_topology()
+
     # Create a Folium map centered at Zelonia
-    m = folium.Map(location=[1.3521+5, 103.8198+120], zoom_start=10, tiles='Cartodb dark_matter')
+    m = create_base_map(topology.center)
 
     # Add outline of Singapore as GeoJSON overlay
-    folium.GeoJson(os.path.join("data/Geojsons", "Zelonia.geojson"), name="geojson").add_to(m)
-    folium.GeoJson(os.path.join("data/Geojsons", "Putonia.geojson"), name="geojson2").add_to(m)
-
-    servers=[ [[1.3521, 103.8198],
-        [1.3578, 103.9870],
-        [1.3196, 103.8253],
-        [1.2901, 103.8029]
-        ],
-        [
-        [1.2912, 103.8375],
-        [1.3480, 103.6830],
-        [1.3139, 103.7657],
-        [1.2984, 103.7736],
-        [1.3340, 103.7359]
-        ],
-        [
-        [1.388307, 103.890594],
-        [1.426724, 103.813737],
-        [1.280952, 103.813019],
-        [1.268026, 103.628778]      
-        ]
-    ]
-
-    for i in servers:
-        for singapore_coordinates in i:
-            singapore_coordinates[0] += 5
-            singapore_coordinates[1] += 120
-
-    # Define headquarters points
-    headquarters = [ [1.257704+5, 103.675321+120],[1.399115+5, 103.814710+120],[1.356555+5, 103.901914+120]]
-    
-    keys = ["Navigation", "Weather", "Corporate"]
+    folium.GeoJson(get_boundary("Zelonia", MAP_ZOOM), name="geojson").add_to(m)
+    folium.GeoJson(get_boundary("Putonia", MAP_ZOOM), name="geojson2").add_to(m)
 
-    for i in range(3):
-        server_status = num_affected_points[keys[i]]
+    for system in topology.systems:
+        server_status = num_affected_points[system.name]
+        hq = system.headquarters
         if server_status == 'Online':
-            hq = headquarters[i]
             folium.Marker(location=hq, icon=folium.Icon(icon='fa-building', prefix='fa', color='blue', icon_color='black')).add_to(m)
-            for point in servers[i]:
-                folium.Marker(location=point, icon=folium.Icon(icon='fa-server', prefix='fa',color='lightgreen', icon_color='black')).add_to(m)
-                folium.PolyLine(locations=[hq, point], color='lightgreen').add_to(m)
+            for start, end in system.links:
+                folium.Marker(location=end, icon=folium.Icon(icon='fa-server', prefix='fa',color='lightgreen', icon_color='black')).add_to(m)
+                folium.PolyLine(locations=[start, end], color='lightgreen').add_to(m)
         elif server_status == 'Isolated':
-            hq = headquarters[i]
             folium.Marker(location=hq, icon=folium.Icon(icon='fa-building', prefix='fa',color='lightgray')).add_to(m)
-            for point in servers[i]:
+            for point in system.servers:
                 folium.Marker(location=point, icon=folium.Icon(icon='fa-server', prefix='fa',color='lightgray')).add_to(m)
         else:
-            hq = headquarters[i]
             folium.Marker(location=hq, icon=folium.Icon(icon='fa-building', prefix='fa',color='lightred', icon_color='black')).add_to(m)
             folium.CircleMarker(location=hq, radius=10, color='black', fill=True, fill_color='red', fill_opacity=0.8).add_to(m)
-            for point in servers[i]:
-                folium.CircleMarker(location=point, radius=4, color='black', fill=True, fill_color='red', fill_opacity=0.8).add_to(m)
-                folium.PolyLine(locations=[point, hq], color='red', weight=1).add_to(m)
+            for start, end in system.links:
+                folium.CircleMarker(location=end, radius=4, color='black', fill=True, fill_color='red', fill_opacity=0.8).add_to(m)
+                folium.PolyLine(locations=[end, start], color='red', weight=1).add_to(m)
 
     if show_attack_server:
-        folium.CircleMarker(location=[7.354704-60, 80.990871-100], radius=10, color='red', fill=True, fill_color='red').add_to(m)
-        for i in range(2):
-            folium.PolyLine(locations=[[7.354704-60, 80.990871-100], headquarters[i]], color='red', weight=2).add_to(m)
+        folium.CircleMarker(location=topology.attack_server, radius=10, color='red', fill=True, fill_color='red').add_to(m)
+        for name in topology.attack_targets:
+            folium.PolyLine(locations=[topology.attack_server, topology.system(name).headquarters], color='red', weight=2).add_to(m)
 
 
     # Add JavaScript for blinking effect
@@ -184,99 +424,77 @@ def create_new_map(num_affected_points, show_attack_server):
     m.get_root().html.add_child(folium.Element(script))
 
     # Convert Folium map to HTML
-    map_html = m._repr_html_()
+    with timer.stage("map_html"):
+        map_html = m._repr_html_()
 
     return map_html
 
-@st.experimental_fragment
 def create_device_map(num_affected_points, show_attack_server):
-    # Create a Folium map centered at Zelonia
-    m = folium.Map(location=[1.3521+5, 103.8198+120], zoom_start=10, tiles='Cartodb dark_matter')
+    key = ("devices", state_fingerprint(num_affected_points, show_attack_server))
+    with timer.stage("device_map"):
+        return get_render_cache().get_or_render(key, lambda: build_device_map(num_affected_points, show_attack_server))
 
-    # Add outline of Singapore as GeoJSON overlay
-    folium.GeoJson(os.path.join("data/Geojsons", "Zelonia.geojson"), name="geojson").add_to(m)
-    folium.GeoJson(os.path.join("data/Geojsons", "Putonia.geojson"), name="geojson2").add_to(m)
-
-    servers=[ [[1.3521, 103.8198],
-        [1.3578, 103.9870],
-        [1.3196, 103.8253],
-        [1.2901, 103.8029],[1.2865, 103.8539], [1.3242, 103.8744],
-        [1.3575, 103.7640],
-        [1.3667, 103.7744],
-        [1.3967, 103.70]],[[1.2912, 103.8375],
-        [1.3480, 103.6830],
-        [1.3139, 103.7657],[1.2984, 103.7736],
-        [1.3340, 103.7359],
-        [1.3199, 103.7655],
-        [1.3151, 103.7480],
-        [1.3329, 103.7065],
-        [1.2996, 103.8334],
-        [1.2831, 103.8165]
-        ],[[1.388307, 103.890594],
-        [1.426724, 103.813737],
-        [1.280952, 103.813019],
-        [1.268026, 103.628778]
-]
-    ]
+# Function to build the devices map HTML for one scenario state. The layout is
+# seeded from the state so the same state always renders the same HTML.
+@timer.timed("device_map_build")
+def build_device_map(num_affected_points, show_attack_server):
+    import folium
+    from device_layer import DeviceLayer
+
+    rng = random.Random(state_seed(state_fingerprint(num_affected_points, show_attack_server)))
 
-    for i in servers:
-        for singapore_coordinates in i:
-            singapore_coordinates[0] += 5
-            singapore_coordinates[1] += 120
+    topology = get_topology()
 
-    # Define headquarters points
-    headquarters = [ [1.257704+5, 103.675321+120],[1.399115+5, 103.814710+120],[1.356555+5, 103.901914+120]]
+    # Create a Folium map centered at Zelonia
+    m = create_base_map(topology.center)
 
-    mobile_url = "data/Images/mobile-phone.png"
-    comp_url = "data/Images/monitor.png"
-    laptop_url = "data/Images/laptop.png"
-    urls = [mobile_url, comp_url, laptop_url]
-    i = 0
-    keys = ["Navigation", "Weather", "Corporate"]
+    # Add outline of Singapore as GeoJSON overlay
+    folium.GeoJson(get_boundary("Zelonia", MAP_ZOOM), name="geojson").add_to(m)
+    folium.GeoJson(get_boundary("Putonia", MAP_ZOOM), name="geojson2").add_to(m)
 
+    devices = []
 
-    for loc in headquarters:
+    for system in topology.systems:
+        loc = system.headquarters
         folium.Marker(location=loc, icon=folium.Icon(icon='fa-building', prefix='fa', color='green', icon_color='black')).add_to(m)
-        points_around_coordinate = generate_points_around_coordinate(loc, random.randint(4,8),random.uniform(0.02,0.05))
+        points_around_coordinate = generate_points_around_coordinate(loc, rng.randint(4,8),rng.uniform(0.02,0.05), rng, get_land_index())
 
-        server_status = num_affected_points[keys[i]]
-        i += 1
+        server_status = num_affected_points[system.name]
 
         if server_status == 'Online':
             folium.Marker(location=loc, icon=folium.Icon(icon='fa-building', prefix='fa', color='lightgreen', icon_color='black')).add_to(m)
-            folium.Circle(location=loc, radius=random.randint(5000,8000), color='lightgreen', fill=True, fill_color='darkgreen', fill_opacity=0.5).add_to(m)
+            folium.Circle(location=loc, radius=rng.randint(5000,8000), color='lightgreen', fill=True, fill_color='darkgreen', fill_opacity=0.5).add_to(m)
             for points in points_around_coordinate:
-                icon = folium.CustomIcon(
-                        random.choice(urls),
-                        icon_size=(20, 20)
-                    )
-
-                folium.Marker(location=points, icon=icon).add_to(m)#folium.Icon(icon='fa-building', prefix='fa', color='red', icon_color='black')).add_to(m)
+                devices.append((points[0], points[1], rng.randrange(len(DEVICE_CLASSES))))
         elif server_status == 'Isolated':
             folium.Marker(location=loc, icon=folium.Icon(icon='fa-building', prefix='fa', color='lightgray', icon_color='black')).add_to(m)
 
         elif server_status == 'Offline':
             folium.Marker(location=loc, icon=folium.Icon(icon='fa-building', prefix='fa', color='black', icon_color='white')).add_to(m)
-            folium.Circle(location=loc, radius=random.randint(5000,8000), color='black', fill=True, fill_color='red', fill_opacity=0.5).add_to(m)
+            folium.Circle(location=loc, radius=rng.randint(5000,8000), color='black', fill=True, fill_color='red', fill_opacity=0.5).add_to(m)
             for points in points_around_coordinate:
-                icon = folium.CustomIcon(
-                        random.choice(urls),
-                        icon_size=(20, 20)
-                    )
+                devices.append((points[0], points[1], rng.randrange(len(DEVICE_CLASSES))))
+
+    # Tag each device with the system of its nearest HQ or server
+    site_index, site_systems = get_site_index()
+    device_points = np.asarray(devices, dtype=np.float64).reshape(-1, 3)
+    nearest, _ = site_index.nearest(device_points[:, 0], device_points[:, 1])
+    tag_names = [f"Nearest site: {name}" for name in topology.system_names]
 
-                folium.Marker(location=points, icon=icon).add_to(m)#folium.Icon(icon='fa-building', prefix='fa', color='red', icon_color='black')).add_to(m)
+    # All devices go into one layer that shares an icon per device class
+    DeviceLayer(devices, DEVICE_CLASSES, tags=site_systems[nearest], tag_names=tag_names).add_to(m)
 
 
     if show_attack_server:
-        folium.CircleMarker(location=[7.354704-60, 80.990871-100], radius=10, color='red', fill=True, fill_color='red').add_to(m)
-        folium.PolyLine(locations=[[7.354704-60, 80.990871-100], [1.406666+5, 103.769391+120]], color='red', weight=2).add_to(m)
+        folium.CircleMarker(location=topology.attack_server, radius=10, color='red', fill=True, fill_color='red').add_to(m)
+        folium.PolyLine(locations=[topology.attack_server, topology.attack_entry_point], color='red', weight=2).add_to(m)
         icon = folium.CustomIcon(
                     "data/Images/virus.png",
                     icon_size=(35, 35)
                 )
-        folium.Marker(location=[1.406666+5, 103.769391+120], icon=icon).add_to(m)
-        for point in headquarters[:2]:
-            folium.PolyLine(locations=[point, [1.406666+5, 103.769391+120]], color='red', weight=2,dash_array='10').add_to(m)
+        folium.Marker(location=topology.attack_entry_point, icon=icon).add_to(m)
+        for name in topology.attack_targets:
+            folium.PolyLine(locations=[topology.system(name).headquarters, topology.attack_entry_point], color='red', weight=2,dash_array='10').add_to(m)
 
 
     # Add JavaScript for blinking effect
@@ -293,92 +511,378 @@ def create_device_map(num_affected_points, show_attack_server):
     m.get_root().html.add_child(folium.Element(script))
 
     # Convert Folium map to HTML
-    map_html = m._repr_html_()
+    with timer.stage("map_html"):
+        map_html = m._repr_html_()
 
     return map_html
 
 
 
-# Function to display system health details
-def display_system_health(system_name, system_status):
-    if system_status == "Online":
-        st.success(f"{system_name} is Online")
-        # Display system health graphics
-        system_health = random.randint(96, 100)  # Random system health value (96 to 100)
-        st.write(f"System Health: {system_health}%")
-        my_bar = st.progress(0)
-
-        for percent_complete in range(system_health):
-            time.sleep(0.02)
-            my_bar.progress(percent_complete + 1)
-
-        # Generate random values for additional parameters for online systems
-        active_instances = random.randint(20, 30)  # Random number of active instances (20 to 30)
-        resource_utilization = random.uniform(60, 80)  # Random resource utilization (60% to 80%)
-        service_availability = random.uniform(99.5, 99.9)  # Random service availability (99.5% to 99.9%)
-
-        # Display additional parameters in a table format
-        st.write("Additional Parameters:")
-        parameter_data = {
+# Function to get the replay slider positions for a list of (time, state)
+# events: every change plus one position every REPLAY_STEP_SECONDS. Positions
+# are whole seconds at least 2s apart so each shows exactly one state.
+def replay_timeline(events, end):
+    changes = {}
+    for timestamp, scenario in events:
+        changes[int(timestamp) // 2 * 2] = scenario
+    timeline = sorted(changes.items())
+    grid = range(timeline[0][0], int(end) + 1, REPLAY_STEP_SECONDS)
+    change_times = [timestamp for timestamp, _ in timeline]
+    positions = []
+    for timestamp in sorted(set(change_times) | {t for t in grid if all(abs(t - c) >= 2 for c in change_times)}):
+        index = bisect.bisect_right(change_times, timestamp) - 1
+        positions.append((timestamp, timeline[index][1]))
+    return positions
+
+def replay_point(location, times, radius, color):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [location[1], location[0]]},
+        "properties": {"times": times, "icon": 'circle',
+                       "iconstyle": {"radius": radius, "color": 'black', "fillColor": color, "fillOpacity": 0.8}},
+    }
+
+# The plugin cuts lines down to the points whose time is on the slider, so a
+# line is repeated once per slider position to show whole at each of them
+def replay_line(start, end, times, color, weight):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "LineString",
+                     "coordinates": [[lon, lat] for _ in times for lat, lon in (start, end)]},
+        "properties": {"times": [t for t in times for _ in range(2)], "style": {"color": color, "weight": weight}},
+    }
+
+# Function to build a servers map that replays a time range of the event log
+# in the browser: one TimestampedGeoJson layer holds every state, so moving
+# the slider needs no round trip to the server
+def build_replay_map(events, end):
+    import folium
+    from folium.plugins import TimestampedGeoJson
+
+    topology = get_topology()
+    m = create_base_map(topology.center)
+    folium.GeoJson(get_boundary("Zelonia", MAP_ZOOM), name="geojson").add_to(m)
+    folium.GeoJson(get_boundary("Putonia", MAP_ZOOM), name="geojson2").add_to(m)
+
+    # Split the positions into runs that show the same state. A feature is
+    # shown from its first time to its last, so each run gets its own features.
+    segments = []
+    for timestamp, scenario in replay_timeline(events, end):
+        if not segments or segments[-1][1] != scenario:
+            segments.append(([], scenario))
+        segments[-1][0].append(timestamp * 1000)
+
+    features = []
+    for times, scenario in segments:
+        for system in topology.systems:
+            color = STATUS_COLORS[scenario[system.name]]
+            features.append(replay_point(system.headquarters, times, 10, color))
+            for start, point in system.links:
+                features.append(replay_point(point, times, 5, color))
+                if scenario[system.name] != 'Isolated':
+                    features.append(replay_line(start, point, times, color, 1))
+        if scenario[ATTACK_SERVER_FOUND]:
+            features.append(replay_point(topology.attack_server, times, 10, 'red'))
+            for name in topology.attack_targets:
+                features.append(replay_line(topology.attack_server, topology.system(name).headquarters, times, 'red', 2))
+
+    TimestampedGeoJson({"type": "FeatureCollection", "features": features}, period=f"PT{REPLAY_STEP_SECONDS}S",
+                       duration="PT1S", add_last_point=False, auto_play=False, loop=False,
+                       date_options="YYYY-MM-DD HH:mm:ss", time_slider_drag_update=True).add_to(m)
+    return m._repr_html_()
+
+# Function to show the replay of a time range in place of the live maps
+def display_replay(start, end):
+    key = ("replay", start, end, len(get_event_log()))
+    if st.session_state.get("replay_map", (None,))[0] != key:
+        events = get_event_log().read_range(start, end)
+        st.session_state["replay_map"] = (key, build_replay_map(events, end) if events else None)
+    _, replay_html = st.session_state["replay_map"]
+    with st.container( border=True):
+        st.markdown("<h2 style='text-align: center;'>Exercise Replay</h2>", unsafe_allow_html=True)
+        if replay_html is None:
+            st.write("No changes were recorded in this time range.")
+        else:
+            components.html(replay_html, height=500)
+
+# Function to show how much storage the last scan covered and how fast files
+# are being checked for encryption
+def display_scan_summary(snapshot):
+    if not snapshot:
+        return
+    summary = f"{snapshot['files']:,} files ({snapshot['bytes'] / 1e9:.1f} GB) scanned in {snapshot['seconds']:.1f}s"
+    if "throughput" in snapshot:
+        throughput = snapshot["throughput"]
+        summary += (f", encryption checks: {throughput['files_per_sec']:.0f} files/s, "
+                    f"{throughput['bytes_per_sec'] / 1e6:.1f} MB/s")
+    st.caption(summary)
+
+# Function to format one telemetry value for the parameter table; a value the
+# system hasn't reported shows as N/A
+def format_metric(value, format_value):
+    return 'N/A' if value is None else format_value(value)
+
+# Function to get the health figures for one system from the telemetry store
+# (no Streamlit calls, so it can run on a worker thread)
+def get_system_health(system_name, system_status, telemetry, trend_view):
+    import pandas as pd
+
+    # A metric the system hasn't reported yet, or reported as NaN, is None
+    latest = {metric: telemetry.latest(system_name, metric) for metric in METRICS}
+    latest = {metric: None if value is None or math.isnan(value) else value for metric, value in latest.items()}
+    if system_status == "Isolated" or latest["system_health"] is None:
+        system_health = None
+        values = ['N/A'] * 3  # Setting all values to N/A
+        status = "⌛"
+    elif system_status == "Online":
+        system_health = round(latest["system_health"])
+        values = [format_metric(latest["active_instances"], round),
+                  format_metric(latest["resource_utilization"], lambda value: f"{value:.2f}%"),
+                  format_metric(latest["service_availability"], lambda value: f"{value:.2f}%")]
+        status = "✅"  # Green tick marks indicating system is active
+    else:
+        system_health = round(latest["system_health"])
+        values = [format_metric(latest[metric], round)
+                  for metric in ("active_instances", "resource_utilization", "service_availability")]
+        status = "❌"  # Red cross marks indicating system is inactive
+
+    times, health_values = telemetry.view(system_name, "system_health", trend_view)
+    trend = pd.DataFrame({"System Health": health_values},
+                         index=pd.to_datetime(times, unit='s'))
+
+    return {
+        "name": system_name,
+        "status": system_status,
+        "system_health": system_health,
+        "trend": trend,
+        "parameter_data": {
             "Parameter": ["Active Instances", "Resource Utilization",
                           "Service Availability"],
-            "Value": [active_instances,
-                      f"{resource_utilization:.2f}%", f"{service_availability:.2f}%"],
-            "Status": ["✅"] * 3  # Green tick marks indicating system is active
+            "Value": values,
+            "Status": [status] * 3
         }
-        parameter_table = st.dataframe(pd.DataFrame(parameter_data).set_index('Parameter'),use_container_width=True)
-        parameter_table.table_style = {"align": "center"}  # Center-align the content
-    
+    }
+
+# Function to draw a progress bar that fills up in the browser, so the script
+# doesn't sleep while the bar animates
+def display_health_bar(system_health):
+    st.markdown(f"""
+    <div style="background-color: {HEALTH_BAR_TRACK_COLOR}; border-radius: 4px; height: 8px; margin-bottom: 1rem;">
+        <div style="background-color: {HEALTH_BAR_COLOR}; border-radius: 4px; height: 8px; width: {system_health}%;
+                    animation: health-bar-fill {system_health * 0.02:.2f}s linear;"></div>
+    </div>
+    <style>@keyframes health-bar-fill {{ from {{ width: 0%; }} }}</style>
+    """, unsafe_allow_html=True)
+
+# Function to display system health details; `trend` and `parameter_table`
+# are the Arrow tables made by build_health_panel
+def display_system_health(health, trend, parameter_table):
+    system_name, system_status = health["name"], health["status"]
+    num_servers = len(get_topology().system(system_name).servers)
+    if system_status == "Online":
+        st.success(f"{system_name} is Online")
+        st.write(f"System Health: {health['system_health']}% across {num_servers} servers")
     elif system_status == "Isolated":
         st.warning(f"{system_name} is Rebooting",icon="⚠️")
         st.write("System Health: N/A")
-        system_health = 0  # Random system health value (96 to 100)
-        my_bar = st.progress(0)
+    else:
+        st.error(f"{system_name} is Offline")
+        st.write(f"System Health: {health['system_health']}% across {num_servers} servers")
+    display_health_bar(health["system_health"] or 0)
+    st.vega_lite_chart(trend, TREND_CHART_SPEC, use_container_width=True)
+
+    # Display additional parameters in a table format
+    st.write("Additional Parameters:")
+    parameter_table = st.dataframe(parameter_table,use_container_width=True,hide_index=True)
+    parameter_table.table_style = {"align": "center"}  # Center-align the content
+
+# Function to build one system's health figures, with its trend and parameter
+# table as Arrow tables (no Streamlit calls, so it can run on a worker thread).
+# Every session shows the same panel, so the tables are converted here once
+# rather than from DataFrames by each chart and table call.
+def build_health_panel(system_name, system_status, telemetry, trend_view):
+    import pandas as pd
+    import pyarrow as pa
+
+    health = get_system_health(system_name, system_status, telemetry, trend_view)
+    trend = pa.Table.from_pandas(health["trend"].rename_axis("Time").reset_index(), preserve_index=False)
+    # The values mix numbers and text, which Streamlit would show as text too
+    parameter_table = pa.Table.from_pandas(pd.DataFrame(health["parameter_data"]).astype(str), preserve_index=False)
+    return health, trend, parameter_table
+
+# Function to get a system's health panel, built once for every session. It is
+# keyed by the system's status and scenario version, the trend window and the
+# telemetry refresh period it belongs to.
+@st.cache_resource(max_entries=PANEL_CACHE_ENTRIES, show_spinner=False)
+def get_health_panel(system_name, system_status, version, trend_view, telemetry_tick):
+    with timer.stage(f"health_panel.{system_name}"):
+        return build_health_panel(system_name, system_status, get_telemetry_collector().store, trend_view)
+
+# Function to get a system's pie chart of file extensions, built once for every
+# session. It is keyed by the system's status and scenario version and by the
+# time its last storage scan finished.
+@st.cache_resource(max_entries=PANEL_CACHE_ENTRIES, show_spinner=False)
+def get_pie_chart(system_name, system_status, version, scan_finished):
+    with timer.stage(f"pie_chart.{system_name}"):
+        return build_pie_chart(scan_file_storage(system_name, system_status, get_file_scanner()))
+
+# Function to build the health panels and pie charts of several systems at
+# once, so the column fragments find them in the shared cache. The worker
+# threads get this session's script context, which st.cache_resource needs.
+def prebuild_system_panels(systems, trend_view):
+    state = get_scenario_state()
+    with ThreadPoolExecutor(max_workers=len(systems), initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as executor:
+        builds = []
+        for name in systems:
+            status = state.get(name)
+            version, telemetry_tick = view_key(state, ("health", name))
+            _, scan_finished = view_key(state, ("files", name))
+            builds.append(executor.submit(timer.bind(get_health_panel), name, status, version, trend_view,
+                                          telemetry_tick))
+            builds.append(executor.submit(timer.bind(get_pie_chart), name, status, version, scan_finished))
+        for build in builds:
+            build.result()
+
+# Function to get the key of what a view of the page shows; the view is drawn
+# again when its key changes. The maps follow the whole scenario. A system's
+# health follows its own status and the telemetry refresh period, and its files
+# follow its own status and its storage scans.
+def view_key(state, view):
+    if view == ("maps",):
+        return state.version
+    kind, system_name = view
+    if kind == "health":
+        return state.version_of([system_name]), int(time.time() // TELEMETRY_REFRESH)
+    file_scanner = get_file_scanner()
+    snapshot = file_scanner.latest(system_name) if file_scanner else None
+    return state.version_of([system_name]), snapshot["finished"] if snapshot else None
+
+# Function to record, from inside the fragment drawing a view, the key it is
+# drawn for; the session's poll compares it with the current one
+def show_view(view):
+    key = view_key(get_scenario_state(), view)
+    st.session_state.setdefault("views", {})[view] = (get_script_run_ctx().current_fragment_id, key)
+    return key
+
+# Function to rerun fragments of this session once the current run ends.
+# Streamlit has no public call for this (st.rerun() reruns the whole page), so
+# the request goes to the session's script runner the same way a browser asks
+# for a fragment rerun. Without a script runner the whole page is rerun. These
+# are Streamlit internals, which is why requirements.txt pins its version.
+def rerun_fragments(fragment_ids):
+    ctx = get_script_run_ctx()
+    if ctx.script_requests is None:
+        st.rerun()
+    for fragment_id in fragment_ids:
+        ctx.script_requests.request_rerun(RerunData(ctx.query_string, page_script_hash=ctx.page_script_hash,
+                                                    fragment_id_queue=[fragment_id]))
+
+# Fragment that checks every STATE_POLL_INTERVAL seconds whether a view of the
+# page is out of date, and reruns only the fragments of those views. It draws
+# nothing; a check is a few integer comparisons.
+@st.experimental_fragment(run_every=STATE_POLL_INTERVAL)
+def poll_for_changes():
+    with session_stages(), timer.stage("poll"):
+        state = get_scenario_state()
+        stale = [fragment_id for view, (fragment_id, key) in st.session_state.get("views", {}).items()
+                 if view_key(state, view) != key]
+        if stale:
+            rerun_fragments(stale)
+
+# Fragment with both maps, drawn again when the poll sees the scenario change
+@st.experimental_fragment
+def display_maps():
+    with session_stages():
+        show_view(("maps",))
+        with timer.stage("state_fetch"):
+            _, scenario = get_scenario_state().snapshot()
+        admin_controls = {name: scenario[name] for name in get_topology().system_names}
+        map_html = create_new_map(admin_controls, scenario[ATTACK_SERVER_FOUND])
+        device_map = create_device_map(admin_controls, scenario[ATTACK_SERVER_FOUND])
 
-        for percent_complete in range(system_health):
-            time.sleep(0.02)
-            my_bar.progress(percent_complete + 1)
+    # Display the map
+    col1,col2 = st.columns(2)
 
-        st.write("Additional Parameters:")
-        parameter_data = {
-            "Parameter": ["Active Instances", "Resource Utilization",
-                        "Service Availability"],
-            "Value": ['N/A'] * 3,  # Setting all values to N/A
-            "Status": ["⌛"] * 3 
-        }
-        parameter_table = st.dataframe(pd.DataFrame(parameter_data).set_index('Parameter'),use_container_width=True)
-        parameter_table.table_style = {"align": "center"}  # Center-align the content
+    with col1:
+        with st.container( border=True):
+            st.markdown("<h2 style='text-align: center;'>Technical Systems Servers</h2>", unsafe_allow_html=True)
+            #st.subheader("Technical Systems Servers", divider="blue")
+            #st.write("Blinking red dots indicate attacked targets")
+            # Render the map based on admin input
+            components.html(map_html, height=400)
 
+    
+    with col2:
+        with st.container( border=True):
+            st.markdown("<h2 style='text-align: center;'>Connected Devices</h2>", unsafe_allow_html=True)
+            #st.subheader("Connected Devices", divider="orange")
+            #st.write("Devices connected to different servers")
+            # Render the map based on admin input
+            components.html(device_map, height=400)
 
+# Fragment with one system's health: its status, health bar, trend chart and
+# parameter table. It is drawn again when the poll sees the system's status
+# change or the telemetry refresh period pass.
+@st.experimental_fragment
+def display_health_section(system_name, trend_view):
+    with session_stages(), timer.stage(f"system_health.{system_name}"):
+        version, telemetry_tick = show_view(("health", system_name))
+        system_status = get_scenario_state().get(system_name)
+        health, trend, parameter_table = get_health_panel(system_name, system_status, version, trend_view,
+                                                          telemetry_tick)
+        display_system_health(health, trend, parameter_table)
+
+# Fragment with one system's pie chart and scan summary, drawn again only when
+# the poll sees the system's status change or a new storage scan finish
+@st.experimental_fragment
+def display_files_section(system_name):
+    with session_stages(), timer.stage(f"system_files.{system_name}"):
+        version, scan_finished = show_view(("files", system_name))
+        pie_chart = get_pie_chart(system_name, get_scenario_state().get(system_name), version, scan_finished)
+        display_pie_charts(system_name, pie_chart)
+        file_scanner = get_file_scanner()
+        display_scan_summary(file_scanner.latest(system_name) if file_scanner else None)
+
+# Function to show the admin how long each stage of the page takes, for their
+# own session or for every session of this process
+def display_stage_timings():
+    import pandas as pd
+
+    with st.sidebar.expander("Performance"):
+        scope = st.radio("Sessions", ["This session", "All sessions"], horizontal=True)
+        timings = st.session_state.get("stage_timings") if scope == "This session" else timer.process
+        rows = timings.summary() if timings else []
+        if rows:
+            st.dataframe(pd.DataFrame(rows).set_index("Stage").round(1), use_container_width=True)
+        else:
+            st.write("No stages timed yet.")
+        st.download_button("Download metrics", timer.process.prometheus_text(), file_name="zelonia_metrics.txt")
+        st.caption(f"Prometheus metrics are served on port {METRICS_PORT} at /metrics")
 
+# Function to apply one of the admin's sidebar controls to the shared scenario.
+# It is the control's on_change callback, which Streamlit calls at the start of
+# whichever rerun brings the new value: a fragment's auto-rerun can replace the
+# full rerun the change requested, and the change must not be lost with it
+def apply_admin_control(key, name):
+    state = get_scenario_state()
+    changed = state.update({name: st.session_state[key]})
+    if changed:
+        get_event_log().append(time.time(), state.snapshot()[1], changed)
 
-    else:
-        st.error(f"{system_name} is Offline")
-        system_health = random.randint(0,2)  # Random system health value (96 to 100)
-        st.write(f"System Health: {system_health}%")
-        my_bar = st.progress(0)
-        for percent_complete in range(system_health):
-            time.sleep(0.02)
-            my_bar.progress(percent_complete + 1)
-        # Display parameters for offline systems with values indicating offline state
-        st.write("Additional Parameters:")
-        parameter_data = {
-            "Parameter": ["Active Instances", "Resource Utilization",
-                          "Service Availability"],
-            "Value": [0] * 3,  # Setting all values to 0 for offline systems
-            "Status": ["❌"] * 3  # Red cross marks indicating system is inactive
-        }
-        parameter_table = st.dataframe(pd.DataFrame(parameter_data).set_index('Parameter'),use_container_width=True)
-        parameter_table.table_style = {"align": "center"}  # Center-align the content
 
 # Main function to create the dashboard
 def main():
+    page_start = time.perf_counter()
     st.markdown("<h1 style='text-align: center;'>Zelonia Technical Systems Dashboard</h1>", unsafe_allow_html=True)
 
-    # Get admin controls from shared global variable
-    admin_controls = get_admin_controls()
-    # Get admin inputs from shared global variable
-    admin_inputs = get_admin_inputs()
+    # Get the scenario state shared by every session, and the systems it covers
+    state = get_scenario_state()
+    system_names = get_topology().system_names
+    # Views this run draws; the fragments below record themselves in it
+    st.session_state["views"] = {}
+    get_telemetry_collector()
+    event_log = get_event_log()
 
     # Sidebar for login
     login = st.sidebar.checkbox("Login as Admin")
@@ -401,64 +905,66 @@ def main():
         st.sidebar.subheader("Admin Controls")
         # Admin controls for system status
         st.sidebar.write("System Status Controls:")
-        for system_name in admin_controls:
-            admin_controls[system_name] = st.sidebar.selectbox(f"{system_name} Status", ["Online", "Isolated", "Offline"])
-
-        
-        admin_inputs['attack_server_found'] = st.sidebar.checkbox("Show attack server: ")
-
-        
-        
-    map_html = create_new_map(admin_controls, admin_inputs['attack_server_found'])
-    # Display the map
-    col1,col2 = st.columns(2)
-
-    device_map = create_device_map(admin_controls, admin_inputs['attack_server_found'])
-
-
-    with col1:
-        with st.container( border=True):
-            st.markdown("<h2 style='text-align: center;'>Technical Systems Servers</h2>", unsafe_allow_html=True)
-            #st.subheader("Technical Systems Servers", divider="blue")
-            #st.write("Blinking red dots indicate attacked targets")
-            # Render the map based on admin input
-            components.html(map_html, height=400)
-
-    
-    with col2:
-        with st.container( border=True):
-            st.markdown("<h2 style='text-align: center;'>Connected Devices</h2>", unsafe_allow_html=True)
-            #st.subheader("Connected Devices", divider="orange")
-            #st.write("Devices connected to different servers")
-            # Render the map based on admin input
-            components.html(device_map, height=400)
+        # The widgets keep fixed defaults and keys: Streamlit derives a widget's id
+        # from its default, so defaulting to the shared scenario would give the
+        # widget a new id (and drop the admin's next change) whenever it changed.
+        # Changes made by other sessions are copied in through session state instead
+        version, scenario = state.snapshot()
+        if st.session_state.get("admin_state_version") != version or "admin_attack_server" not in st.session_state:
+            for system_name in system_names:
+                st.session_state[f"admin_status_{system_name}"] = scenario[system_name]
+            st.session_state["admin_attack_server"] = scenario[ATTACK_SERVER_FOUND]
+        for system_name in system_names:
+            st.sidebar.selectbox(f"{system_name} Status", SYSTEM_STATUSES, key=f"admin_status_{system_name}",
+                                 on_change=apply_admin_control, args=(f"admin_status_{system_name}", system_name))
+
+        st.sidebar.checkbox("Show attack server: ", key="admin_attack_server",
+                            on_change=apply_admin_control, args=("admin_attack_server", ATTACK_SERVER_FOUND))
+        st.session_state["admin_state_version"] = version
+
+        startup = get_startup_report()
+        if startup["first_paint"] is not None:
+            cold_start = f"{startup['cold_start']:.1f}s" if startup["cold_start"] is not None else "not warmed up"
+            st.sidebar.caption(f"Cold start: {cold_start} | First paint: {startup['first_paint']:.2f}s")
+        dropped = get_telemetry_collector().store.dropped
+        if dropped:
+            st.sidebar.caption(f"Telemetry samples dropped (unknown system or metric): {dropped:,}")
+        if timer.enabled:
+            display_stage_timings()
+
+    # Replay of the recorded admin changes
+    replay_range = None
+    if admin_access and st.sidebar.checkbox("Replay exercise"):
+        first, last = event_log.bounds()
+        start, end = datetime.fromtimestamp(int(first)), datetime.fromtimestamp(int(last) + 1)
+        replay_range = st.sidebar.slider("Time range", min_value=start, max_value=end, value=(start, end),
+                                         step=timedelta(minutes=1), format="HH:mm")
+
+    if replay_range:
+        display_replay(replay_range[0].timestamp(), replay_range[1].timestamp())
+    else:
+        display_maps()
 
-    
-    sys_col1, sys_col2, sys_col3 = st.columns(3)
-    system_tabs = ["Navigation", "Weather", "Corporate"]
+    trend_view = st.radio("Health trend", list(VIEWS), horizontal=True)
+    # Build every missing panel at once before the column fragments draw them
+    prebuild_system_panels(system_names, trend_view)
 
-    with sys_col1:
-        with st.container( border=True):
-            selected_tab = system_tabs[0]
-            display_system_health(selected_tab, admin_controls[selected_tab])
-            scanned_results = scan_file_storage(selected_tab, admin_controls[selected_tab])
-            display_pie_charts(selected_tab, scanned_results)
+    for sys_col, system_name in zip(st.columns(len(system_names)), system_names):
+        with sys_col, st.container(border=True):
+            display_health_section(system_name, trend_view)
+            display_files_section(system_name)
+    poll_for_changes()
 
-    with sys_col2:
-        with st.container( border=True):
-            selected_tab = system_tabs[1]
-            display_system_health(selected_tab, admin_controls[selected_tab])
-            scanned_results = scan_file_storage(selected_tab, admin_controls[selected_tab])
-            display_pie_charts(selected_tab, scanned_results)
-
-    with sys_col3:
-        with st.container( border=True):
-            selected_tab = system_tabs[2]
-            display_system_health(selected_tab, admin_controls[selected_tab])
-            scanned_results = scan_file_storage(selected_tab, admin_controls[selected_tab])
-            display_pie_charts(selected_tab, scanned_results)
+    record_first_paint(time.perf_counter() - page_start)
 
 
-# Run the dashboard
+# Run the dashboard. serve.py runs only the warm-up here before starting the server.
 if __name__ == "__main__":
-    main()
+    if os.environ.get("ZELONIA_WARM_UP_ONLY") == "1":
+        startup = warm_up()
+        print("Warm-up: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in startup["warm_up"].items()))
+        if startup["cold_start"] is not None:
+            print(f"Cold start: {startup['cold_start']:.2f}s")
+    else:
+        with session_stages(), timer.stage("page"):
+            main()
@@ -0,0 +1,242 @@
+import argparse
+import copy
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from generate_new_geojson import geometry_parts, iter_geometries, offset_geojson, rebuild_geometry  # noqa: E402
+from render_cache import all_states  # noqa: E402
+from simplify_geojson import load_boundary  # noqa: E402
+from topology import System, Topology, load_topology  # noqa: E402
+
+APP_FILE = os.path.join(ROOT, "app.py")
+# Each scale multiplies the servers per system and the boundary vertex count
+SCALES = (1, 4, 16)
+BOUNDARIES = ("Zelonia", "Putonia")
+MAP_ZOOM = 10
+SERVER_SPREAD_DEGREES = 0.15
+RERUN_TIMEOUT = 120
+# Tracing allocations takes several times longer than the calls themselves
+TRACE_MEMORY = True
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, round(time.perf_counter() - start, 4)
+
+
+# Function to measure one call: its time, then its peak traced allocation in a
+# second call (tracing slows the call down, so the two are kept apart)
+def measure(function, *args):
+    result, seconds = timed(function, *args)
+    if not TRACE_MEMORY:
+        return result, {"seconds": seconds, "peak_bytes": None}
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": seconds, "peak_bytes": peak}
+
+
+# Function to scale the real topology up: each system gets `scale` times its
+# servers, the extra ones placed around its headquarters
+def synthetic_topology(scale, seed=0):
+    topology = load_topology(os.path.join(ROOT, "data/topology.json"))
+    rng = random.Random(seed)
+    systems = []
+    for system in topology.systems:
+        lat, lon = system.headquarters
+        extra = tuple((lat + rng.uniform(-SERVER_SPREAD_DEGREES, SERVER_SPREAD_DEGREES),
+                       lon + rng.uniform(-SERVER_SPREAD_DEGREES, SERVER_SPREAD_DEGREES))
+                      for _ in range(len(system.servers) * (scale - 1)))
+        systems.append(System(system.name, system.headquarters, system.servers + extra))
+    return Topology(topology.center, tuple(systems), topology.attack_server,
+                    topology.attack_entry_point, topology.attack_targets)
+
+
+# Function to scale a boundary up by putting `scale - 1` evenly spaced points
+# into every edge, so the outline looks the same with `scale` times the vertices
+def synthetic_boundary(name, scale):
+    boundary = copy.deepcopy(load_boundary(name, MAP_ZOOM))
+    steps = np.arange(scale) / scale
+    for geometry in iter_geometries(boundary):
+        parts = []
+        for ring in geometry_parts(geometry, []):
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 2:
+                parts.append(ring.tolist())
+                continue
+            edges = ring[:-1, None, :] + (ring[1:] - ring[:-1])[:, None, :] * steps[None, :, None]
+            parts.append(np.vstack([edges.reshape(-1, ring.shape[1]), ring[-1:]]).tolist())
+        rebuild_geometry(geometry, iter(parts))
+    return boundary
+
+
+def count_vertices(boundary):
+    return sum(len(part) for geometry in iter_geometries(boundary) for part in geometry_parts(geometry, []))
+
+
+# Function to import app.py. Outside a Streamlit session st.cache_resource
+# never returns a cached value, so the resources the builders look up are
+# pinned to single instances (and later to the synthetic data).
+def load_app():
+    import app
+
+    land_index, tile_server, telemetry = app.get_land_index(), app.get_tile_server(), app.get_telemetry_collector()
+    app.get_land_index = lambda: land_index
+    app.get_tile_server = lambda: tile_server
+    app.get_telemetry_collector = lambda: telemetry
+    return app
+
+
+# Function to build a system's pie chart from its sample file breakdown
+def build_pie_chart(app, system_name, status):
+    return app.build_pie_chart(app.scan_file_storage(system_name, status))
+
+
+# Function to benchmark the map and panel builders for every scenario state
+def bench_functions(app, scale):
+    topology = synthetic_topology(scale)
+    boundaries = {name: synthetic_boundary(name, scale) for name in BOUNDARIES}
+    app.get_topology = lambda: topology
+    app.get_boundary = lambda name, zoom: boundaries[name]
+    telemetry = app.get_telemetry_collector().store
+    trend_view = next(iter(app.VIEWS))
+
+    states = []
+    for admin_controls, attack_server_found in all_states(topology.system_names):
+        result = {"statuses": admin_controls, "attack_server_found": attack_server_found}
+        for name, build in (("server_map", app.build_server_map), ("device_map", app.build_device_map)):
+            html, result[name] = measure(build, admin_controls, attack_server_found)
+            result[name]["html_bytes"] = len(html.encode("utf-8"))
+        result["health_panels"] = {
+            name: measure(app.build_health_panel, name, admin_controls[name], telemetry, trend_view)[1]
+            for name in topology.system_names}
+        result["pie_charts"] = {
+            name: measure(build_pie_chart, app, name, admin_controls[name])[1] for name in topology.system_names}
+        states.append(result)
+
+    servers = sum(len(system.servers) for system in topology.systems)
+    vertices = sum(count_vertices(boundary) for boundary in boundaries.values())
+    summary = {key: summarize([state[key] for state in states]) for key in ("server_map", "device_map")}
+    for key in ("health_panels", "pie_charts"):
+        summary[key] = summarize([panel for state in states for panel in state[key].values()])
+    print(f"scale {scale:>3} ({servers} servers, {vertices} boundary vertices): "
+          + " | ".join(f"{key} {value['mean_seconds']:.3f}s" + (f" {value['mean_html_bytes'] / 1024:.0f} KB"
+                                                                  if "mean_html_bytes" in value else "")
+                       for key, value in summary.items()))
+    return {"scale": scale, "servers": servers, "boundary_vertices": vertices, "summary": summary, "states": states}
+
+
+# Function to benchmark offset_geojson on the boundary file at one scale
+def bench_offset_geojson(scale, directory):
+    input_file = os.path.join(directory, f"boundary_{scale}.geojson")
+    output_file = os.path.join(directory, f"boundary_{scale}_offset.geojson")
+    boundary = synthetic_boundary("Zelonia", scale)
+    with open(input_file, 'w') as f:
+        json.dump(boundary, f)
+    _, result = measure(offset_geojson, input_file, output_file, 120, 5)
+    result.update(scale=scale, vertices=count_vertices(boundary), file_bytes=os.path.getsize(input_file))
+    print(f"scale {scale:>3}: offset_geojson {result['seconds']:.3f}s on {result['file_bytes'] / 1024:.0f} KB")
+    return result
+
+
+def summarize(results):
+    summary = {"mean_seconds": round(sum(r["seconds"] for r in results) / len(results), 4),
+               "max_seconds": max(r["seconds"] for r in results),
+               "max_peak_bytes": max(r["peak_bytes"] or 0 for r in results) if TRACE_MEMORY else None}
+    if "html_bytes" in results[0]:
+        summary["mean_html_bytes"] = round(sum(r["html_bytes"] for r in results) / len(results))
+    return summary
+
+
+# Function to time full main() reruns headlessly: an admin session steps
+# through every scenario state (rendering each state's maps the first time)
+# and a viewer session reruns after each change, as a participant's tab would
+def bench_reruns():
+    from streamlit.testing.v1 import AppTest
+
+    admin = AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT)
+    viewer = AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT)
+    _, first_seconds = timed(viewer.run)
+    admin.run()
+    admin.sidebar.checkbox[0].check().run()
+    admin.sidebar.text_input[0].input("admin")
+    admin.sidebar.text_input[1].input("password").run()
+
+    system_names = load_topology(os.path.join(ROOT, "data/topology.json")).system_names
+    reruns = []
+    for admin_controls, attack_server_found in all_states(system_names):
+        for selectbox, name in zip(admin.sidebar.selectbox, system_names):
+            selectbox.select(admin_controls[name])
+        admin.sidebar.checkbox[1].set_value(attack_server_found)
+        _, admin_seconds = timed(admin.run)
+        _, viewer_seconds = timed(viewer.run)
+        if admin.exception or viewer.exception:
+            sys.exit(f"Rerun failed: {(admin.exception or viewer.exception)[0].message}")
+        reruns.append({"statuses": admin_controls, "attack_server_found": attack_server_found,
+                       "admin_seconds": admin_seconds, "viewer_seconds": viewer_seconds})
+
+    result = {"first_run_seconds": first_seconds,
+              "mean_admin_seconds": round(sum(r["admin_seconds"] for r in reruns) / len(reruns), 4),
+              "mean_viewer_seconds": round(sum(r["viewer_seconds"] for r in reruns) / len(reruns), 4),
+              "reruns": reruns}
+    print(f"main() reruns: first {first_seconds:.3f}s | admin change {result['mean_admin_seconds']:.3f}s "
+          f"| viewer {result['mean_viewer_seconds']:.3f}s")
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's map, panel and rerun times")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES,
+                        help="Topology and boundary size multipliers (default: %(default)s)")
+    parser.add_argument("--skip-memory", action="store_true", help="Don't trace peak memory per call")
+    parser.add_argument("--skip-reruns", action="store_true", help="Don't time full main() reruns")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.skip_memory
+
+    os.chdir(ROOT)
+    # folium warns about the CARTO basemap on every map it builds
+    warnings.filterwarnings("ignore", message="CartoDB tiles")
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep the benchmark's admin changes and start-up times out of the real logs
+        os.environ["ZELONIA_EVENT_LOG"] = os.path.join(directory, "events.jsonl")
+        os.environ["ZELONIA_STARTUP_LOG"] = os.path.join(directory, "startup.jsonl")
+
+        app = load_app()
+        results = {"commit": git_commit(),
+                   "functions": [bench_functions(app, scale) for scale in args.scales],
+                   "offset_geojson": [bench_offset_geojson(scale, directory) for scale in args.scales]}
+        if not args.skip_reruns:
+            results["main_reruns"] = bench_reruns()
+    results["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import folium
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from device_layer import DeviceLayer  # noqa: E402
+
+DEVICE_CLASSES = [
+    {"icon": "data/Images/mobile-phone.png", "icon_size": (20, 20), "color": '#1f77b4'},
+    {"icon": "data/Images/monitor.png", "icon_size": (20, 20), "color": '#ff7f0e'},
+    {"icon": "data/Images/laptop.png", "icon_size": (20, 20), "color": '#2ca02c'},
+]
+SIZES = (1000, 10000, 100000)
+# The old one-marker-per-device layout embeds an icon per device; past this
+# many devices its HTML runs into hundreds of megabytes, so it is skipped
+LEGACY_MAX_DEVICES = 10000
+
+
+def random_devices(num_devices, seed=0):
+    rng = random.Random(seed)
+    return [(6.35 + rng.uniform(-0.1, 0.1), 223.82 + rng.uniform(-0.2, 0.2), rng.randrange(len(DEVICE_CLASSES)))
+            for _ in range(num_devices)]
+
+
+# Function to build a map with one folium.Marker and CustomIcon per device,
+# as create_device_map used to
+def build_legacy(devices):
+    m = folium.Map(location=[6.3521, 223.8198], zoom_start=10, tiles='Cartodb dark_matter')
+    for lat, lon, device_class in devices:
+        icon = folium.CustomIcon(DEVICE_CLASSES[device_class]["icon"], icon_size=(20, 20))
+        folium.Marker(location=(lat, lon), icon=icon).add_to(m)
+    return m._repr_html_()
+
+
+def build_device_layer(devices):
+    m = folium.Map(location=[6.3521, 223.8198], zoom_start=10, tiles='Cartodb dark_matter')
+    DeviceLayer(devices, DEVICE_CLASSES).add_to(m)
+    return m._repr_html_()
+
+
+def measure(build, devices):
+    start = time.perf_counter()
+    html = build(devices)
+    return {"build_seconds": round(time.perf_counter() - start, 4), "html_bytes": len(html.encode("utf-8"))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the devices map layer at increasing device counts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Device counts (default: %(default)s)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for num_devices in args.sizes:
+        devices = random_devices(num_devices)
+        result = {"devices": num_devices, "device_layer": measure(build_device_layer, devices)}
+        if num_devices <= LEGACY_MAX_DEVICES:
+            result["legacy_markers"] = measure(build_legacy, devices)
+        results.append(result)
+
+        layer = result["device_layer"]
+        line = f"{num_devices:>7} devices: device layer {layer['build_seconds']:.3f}s {layer['html_bytes'] / 1024:.0f} KB"
+        if "legacy_markers" in result:
+            legacy = result["legacy_markers"]
+            line += f" | per-device markers {legacy['build_seconds']:.3f}s {legacy['html_bytes'] / 1024:.0f} KB"
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
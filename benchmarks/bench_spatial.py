@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simplify_geojson import load_boundary  # noqa: E402
+from spatial import BoundaryIndex, PointIndex, random_points_on_land  # noqa: E402
+
+SIZES = (10000, 100000, 500000)
+# About the HQs and servers of the largest topology bench_dashboard.py builds
+NUM_SERVERS = 250
+HEADQUARTERS_CENTER = np.array([6.3577, 223.8])
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, round(time.perf_counter() - start, 4)
+
+
+# Function to check a sample of points against a plain ray cast over every edge
+def check_contains(index, lats, lons, inside, sample=2000):
+    py, px = lats[:sample, None], lons[:sample, None]
+    spans = (index.y1 > py) != (index.y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = index.x1 + (py - index.y1) * (index.x2 - index.x1) / (index.y2 - index.y1)
+    expected = np.count_nonzero(spans & (px < crossing_x), axis=1) % 2 == 1
+    return int((expected != inside[:sample]).sum())
+
+
+# Function to check a sample of nearest() results against a plain loop over
+# every indexed point
+def check_nearest(index, lats, lons, nearest, sample=2000):
+    mismatches = 0
+    for lat, lon, found in zip(lats[:sample], lons[:sample], nearest[:sample]):
+        distances = np.hypot(index.xy[:, 0] - lon * index.lon_scale, index.xy[:, 1] - lat)
+        mismatches += distances[found] > distances.min()
+    return int(mismatches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark point-in-polygon and nearest-neighbour queries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Query counts (default: %(default)s)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    land, build_seconds = timed(BoundaryIndex, load_boundary("Zelonia"))
+    print(f"Boundary index: {len(land.x1)} edges in {build_seconds:.3f}s")
+    server_points = random_points_on_land(land, HEADQUARTERS_CENTER, NUM_SERVERS, 0.5, rng)
+    servers, server_seconds = timed(PointIndex, server_points)
+
+    results = []
+    for num_points in args.sizes:
+        lats = rng.uniform(land.min_lat, land.max_lat, num_points)
+        lons = rng.uniform(land.min_lon, land.max_lon, num_points)
+        inside, contains_seconds = timed(land.contains, lats, lons)
+        (nearest, _), nearest_seconds = timed(servers.nearest, lats, lons)
+        _, placed_seconds = timed(random_points_on_land, land, HEADQUARTERS_CENTER, num_points, 0.3, rng)
+        results.append({
+            "points": num_points,
+            "contains_seconds": contains_seconds,
+            "contains_mismatches": check_contains(land, lats, lons, inside),
+            "nearest_seconds": nearest_seconds,
+            "nearest_mismatches": check_nearest(servers, lats, lons, nearest),
+            "place_on_land_seconds": placed_seconds,
+        })
+        print(f"{num_points:>7} points: contains {contains_seconds:.3f}s | nearest of {NUM_SERVERS} servers "
+              f"{nearest_seconds:.3f}s | place on land {placed_seconds:.3f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"boundary_build_seconds": build_seconds, "server_index_seconds": server_seconds,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
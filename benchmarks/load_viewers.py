@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from render_cache import SYSTEM_STATUSES, all_states  # noqa: E402
+from scenario_state import ATTACK_SERVER_FOUND, default_state  # noqa: E402
+from topology import load_topology  # noqa: E402
+
+VIEWER_COUNTS = (10, 50, 100)
+DURATION = 60  # Seconds of load per viewer count
+CHANGE_INTERVAL = 10.0  # Seconds between the admin's changes
+RAMP_UP = 10.0  # Seconds over which the viewers connect
+SETTLE = 5.0  # Seconds after the last viewer connects before the first change
+LOGIN_TIMEOUT = 60
+# Sidebar widget labels the admin uses, as app.py shows them
+LOGIN_LABEL = "Login as Admin"
+USERNAME_LABEL, PASSWORD_LABEL = "Username", "Password"
+ATTACK_SERVER_LABEL = "Show attack server: "
+WIDGET_TYPES = ("checkbox", "text_input", "selectbox")
+STARTUP_TIMEOUT = 120
+SAMPLE_INTERVAL = 1.0  # Seconds between server CPU and memory samples
+# Maps on the page (servers and devices); a viewer is up to date once it has both
+MAPS_PER_PAGE = 2
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+# Function to start the dashboard through serve.py (so it is warmed up like
+# in production) with the given scenario state backend: "memory", the default
+# of a single server, or "sqlite", which several processes would share
+def start_server(port, directory, state_backend):
+    env = dict(os.environ,
+               ZELONIA_EVENT_LOG=os.path.join(directory, "events.jsonl"),
+               ZELONIA_STARTUP_LOG=os.path.join(directory, "startup.jsonl"))
+    env["ZELONIA_STATE"] = "sqlite:" + os.path.join(directory, "state.db") if state_backend == "sqlite" else "memory"
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "serve.py"), "--server.port", str(port), "--server.headless", "true",
+         "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Dashboard exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.5)
+    process.kill()
+    sys.exit(f"Dashboard did not start within {STARTUP_TIMEOUT}s")
+
+
+# Function to read a process's CPU seconds and resident memory from /proc
+def process_usage(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    with open(f"/proc/{pid}/status") as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    return cpu_seconds, rss_kb
+
+
+# One viewer tab: it runs the page, then reruns each fragment on the interval
+# the server asks for, as the browser does. It records every map it is sent.
+class Viewer:
+    def __init__(self, url):
+        self.url = url
+        self.page_script_hash = ""
+        self.messages = {}  # Message hash -> message, for the server's references
+        self.maps = []  # (time, hash of the HTML) of every map received
+        self.fragments = {}
+        self.widget_states = {}  # Label -> WidgetState, sent with every rerun as a browser does
+        self.reruns = 0
+        self.connection = None
+
+    async def run(self, stop):
+        self.connection = await websocket_connect(self.url, subprotocols=["streamlit"],
+                                                  max_message_size=256 * 1024 * 1024)
+        self.rerun()
+        while not stop.is_set():
+            data = await self.connection.read_message()
+            if data is None:
+                break
+            self.handle(ForwardMsg.FromString(data))
+        for task in self.fragments.values():
+            task.cancel()
+        self.connection.close()
+
+    def rerun(self, fragment_id=""):
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        msg.rerun_script.fragment_id = fragment_id
+        msg.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+        self.connection.write_message(msg.SerializeToString(), binary=True)
+
+    async def rerun_fragment(self, fragment_id, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.rerun(fragment_id)
+
+    def handle(self, msg):
+        if msg.metadata.cacheable:
+            self.messages[msg.hash] = msg
+        if msg.WhichOneof("type") == "ref_hash":
+            msg = self.messages[msg.ref_hash]
+        kind = msg.WhichOneof("type")
+
+        if kind == "new_session":
+            self.page_script_hash = msg.new_session.page_script_hash
+        elif kind == "auto_rerun" and msg.auto_rerun.fragment_id not in self.fragments:
+            self.fragments[msg.auto_rerun.fragment_id] = asyncio.ensure_future(
+                self.rerun_fragment(msg.auto_rerun.fragment_id, msg.auto_rerun.interval))
+        elif kind == "script_finished":
+            self.reruns += 1
+        elif kind == "delta" and msg.delta.new_element.WhichOneof("type") == "iframe":
+            digest = hashlib.sha1(msg.delta.new_element.iframe.srcdoc.encode("utf-8")).digest()
+            self.maps.append((time.monotonic(), digest))
+
+
+# The admin's tab: a viewer that logs in through the sidebar and changes the
+# scenario with the status selectboxes and the attack server checkbox, so its
+# changes go through a real session and its own reruns load the server too
+class Admin(Viewer):
+    def __init__(self, url, system_names):
+        super().__init__(url)
+        self.system_names = system_names
+        self.widgets = {}  # Label -> widget id of every widget seen so far
+        self.change_sent = None
+        self.change_run_started = False
+        self.rerun_seconds = []  # Time from each change to the run that applied it
+
+    def handle(self, msg):
+        super().handle(msg)
+        if msg.WhichOneof("type") == "ref_hash":
+            msg = self.messages[msg.ref_hash]
+        kind = msg.WhichOneof("type")
+        if kind == "delta" and msg.delta.new_element.WhichOneof("type") in WIDGET_TYPES:
+            widget = getattr(msg.delta.new_element, msg.delta.new_element.WhichOneof("type"))
+            self.widgets[widget.label] = widget.id
+        # The change is applied by the first run to start after it was sent: the
+        # full rerun, or the fragment auto-rerun that replaced it under load. Every
+        # run starts with a new_session message; a run that finished just before
+        # the change arrived does not count
+        elif kind == "new_session" and self.change_sent is not None:
+            self.change_run_started = True
+        elif (kind == "script_finished" and self.change_run_started and msg.script_finished
+              in (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)):
+            self.rerun_seconds.append(time.monotonic() - self.change_sent)
+            self.change_sent, self.change_run_started = None, False
+
+    def set_widget(self, label, **value):
+        self.widget_states[label] = WidgetState(id=self.widgets[label], **value)
+
+    async def wait_for_widget(self, label):
+        deadline = time.monotonic() + LOGIN_TIMEOUT
+        while label not in self.widgets:
+            if time.monotonic() > deadline:
+                sys.exit(f"The admin never saw the {label!r} widget")
+            await asyncio.sleep(0.05)
+
+    async def log_in(self):
+        await self.wait_for_widget(LOGIN_LABEL)
+        self.set_widget(LOGIN_LABEL, bool_value=True)
+        self.rerun()
+        await self.wait_for_widget(PASSWORD_LABEL)
+        self.set_widget(USERNAME_LABEL, string_value="admin")
+        self.set_widget(PASSWORD_LABEL, string_value="password")
+        self.rerun()
+        await self.wait_for_widget(ATTACK_SERVER_LABEL)
+
+    def change(self, admin_controls, attack_server_found):
+        for name in self.system_names:
+            self.set_widget(f"{name} Status", int_value=SYSTEM_STATUSES.index(admin_controls[name]))
+        self.set_widget(ATTACK_SERVER_LABEL, bool_value=attack_server_found)
+        self.change_sent, self.change_run_started = time.monotonic(), False
+        self.rerun()
+
+
+# Function to have the admin change the scenario to a different random state
+# on a schedule; each change is timed from the moment the admin sends it
+async def change_state_periodically(admin, interval, stop, changes):
+    rng = random.Random(0)
+    states = list(all_states(admin.system_names))
+    current = default_state(admin.system_names)
+    while True:
+        await asyncio.sleep(interval)
+        if stop.is_set():
+            return
+        admin_controls, attack_server_found = rng.choice(
+            [s for s in states if {**s[0], ATTACK_SERVER_FOUND: s[1]} != current])
+        current = {**admin_controls, ATTACK_SERVER_FOUND: attack_server_found}
+        changes.append(time.monotonic())
+        admin.change(admin_controls, attack_server_found)
+
+
+async def sample_usage(pid, stop, samples):
+    while not stop.is_set():
+        samples.append((time.monotonic(), *process_usage(pid)))
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+
+# Function to get each viewer's time from every admin change to the moment it
+# had been sent every map of the new state (maps it was not sent since the
+# previous change); changes a viewer missed are counted
+def map_latencies(viewers, changes, end):
+    latencies, missed = [], 0
+    for viewer in viewers:
+        for previous, start, until in zip([0.0] + changes, changes, changes[1:] + [end]):
+            shown_before = {digest for timestamp, digest in viewer.maps if previous <= timestamp < start}
+            new_maps = set()
+            for timestamp, digest in viewer.maps:
+                if start <= timestamp < until and digest not in shown_before:
+                    new_maps.add(digest)
+                    if len(new_maps) == MAPS_PER_PAGE:
+                        latencies.append(timestamp - start)
+                        break
+            else:
+                missed += 1
+    return latencies, missed
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_load(url, pid, system_names, num_viewers, duration, change_interval):
+    stop, stop_admin = asyncio.Event(), asyncio.Event()
+    viewers, tasks, changes, samples = [], [], [], []
+    tasks.append(asyncio.ensure_future(sample_usage(pid, stop, samples)))
+    admin = Admin(url, system_names)
+    tasks.append(asyncio.ensure_future(admin.run(stop)))
+    await admin.log_in()
+    for _ in range(num_viewers):
+        viewer = Viewer(url)
+        viewers.append(viewer)
+        tasks.append(asyncio.ensure_future(viewer.run(stop)))
+        await asyncio.sleep(RAMP_UP / num_viewers)
+    await asyncio.sleep(SETTLE)
+
+    start, client_start = time.monotonic(), time.process_time()
+    reruns_before = sum(viewer.reruns for viewer in viewers)
+    changer = asyncio.ensure_future(change_state_periodically(admin, change_interval, stop_admin, changes))
+    await asyncio.sleep(duration)
+    end, client_end = time.monotonic(), time.process_time()
+    reruns = sum(viewer.reruns for viewer in viewers) - reruns_before
+    stop_admin.set()
+    changer.cancel()
+    await asyncio.sleep(change_interval)  # Let the viewers catch up with the last change
+    stop.set()
+    for task in tasks:
+        task.cancel()
+
+    latencies, missed = map_latencies(viewers, changes, end + change_interval)
+    under_load = [sample for sample in samples if start <= sample[0] <= end]
+    first, last = under_load[0], under_load[-1]
+    return {
+        "viewers": num_viewers,
+        "admin_changes": len(changes),
+        "reruns_per_second": round(reruns / (end - start), 2),
+        "map_update_p50_seconds": percentile(latencies, 0.5),
+        "map_update_p99_seconds": percentile(latencies, 0.99),
+        "map_updates_missed": missed,
+        "admin_rerun_p50_seconds": percentile(admin.rerun_seconds, 0.5),
+        "admin_rerun_p99_seconds": percentile(admin.rerun_seconds, 0.99),
+        "server_cpu_percent": round(100 * (last[1] - first[1]) / (last[0] - first[0]), 1),
+        "server_peak_rss_mb": round(max(sample[2] for sample in samples) / 1024, 1),
+        # If this nears a full core, the simulated viewers are the bottleneck
+        "load_generator_cpu_percent": round(100 * (client_end - client_start) / (end - start), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with concurrent viewer sessions while an "
+                                                 "admin changes the scenario")
+    parser.add_argument("--viewers", type=int, nargs="+", default=VIEWER_COUNTS,
+                        help="Viewer counts to test, each on a fresh server (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=DURATION, help="Seconds of load per viewer count")
+    parser.add_argument("--change-interval", type=float, default=CHANGE_INTERVAL,
+                        help="Seconds between the admin's changes")
+    parser.add_argument("--state-backend", choices=("memory", "sqlite"), default="memory",
+                        help="Scenario state backend of the server: memory (the single-server default) or sqlite "
+                             "(shared by several processes) (default: %(default)s)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    system_names = load_topology(os.path.join(ROOT, "data/topology.json")).system_names
+    results = []
+    for num_viewers in args.viewers:
+        with tempfile.TemporaryDirectory() as directory:
+            port = free_port()
+            server = start_server(port, directory, args.state_backend)
+            try:
+                result = asyncio.run(run_load(f"ws://localhost:{port}/_stcore/stream", server.pid, system_names,
+                                              num_viewers, args.duration, args.change_interval))
+            finally:
+                server.terminate()
+                server.wait()
+        result["state_backend"] = args.state_backend
+        results.append(result)
+        p50, p99 = result["map_update_p50_seconds"], result["map_update_p99_seconds"]
+        print(f"{num_viewers:>4} viewers: {result['reruns_per_second']:.1f} reruns/s | map update "
+              + (f"p50 {p50:.2f}s p99 {p99:.2f}s" if p50 is not None else "never seen")
+              + f" ({result['map_updates_missed']} missed) | admin rerun p50 "
+              + (f"{result['admin_rerun_p50_seconds']:.2f}s" if result["admin_rerun_p50_seconds"] is not None else "n/a")
+              + f" | server CPU {result['server_cpu_percent']:.0f}% "
+              f"RSS {result['server_peak_rss_mb']:.0f} MB | load generator CPU {result['load_generator_cpu_percent']:.0f}%")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import functools
+import json
+
+import numpy as np
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from folium.utilities import image_to_url
+from jinja2 import Template
+
+# Up to this many devices every device gets its own icon marker
+CLUSTER_THRESHOLD = 500
+# Up to this many devices icon markers are clustered; above it devices are
+# drawn as circles on a single canvas
+CANVAS_THRESHOLD = 20000
+# About one metre, far below what the maps can show
+COORDINATE_DECIMALS = 5
+
+
+# Function to encode devices as two compact arrays: flat [lat, lon, lat, lon, ...]
+# and one device class index per device
+def encode_devices(devices):
+    devices = np.asarray(devices, dtype=np.float64).reshape(-1, 3)
+    locations = devices[:, :2].round(COORDINATE_DECIMALS).ravel().tolist()
+    classes = devices[:, 2].astype(np.int64).tolist()
+    return json.dumps(locations, separators=(',', ':')), json.dumps(classes, separators=(',', ':'))
+
+
+# Function to get an icon as a data URL; files are read and encoded once per process
+@functools.lru_cache(maxsize=None)
+def icon_url(path):
+    return image_to_url(path)
+
+
+def pick_mode(num_devices):
+    if num_devices <= CLUSTER_THRESHOLD:
+        return 'markers'
+    elif num_devices <= CANVAS_THRESHOLD:
+        return 'cluster'
+    return 'canvas'
+
+
+# One Leaflet layer holding every device of a map. Devices are (lat, lon, class)
+# rows; each class is declared once with its icon and colour:
+#   {"icon": "data/Images/laptop.png", "icon_size": (20, 20), "color": "#1f77b4"}
+# Devices can also be tagged: `tags` holds one index into `tag_names` per
+# device, shown as the device's tooltip. The browser builds the markers from
+# the arrays, so the HTML grows by a few bytes per device instead of a full
+# marker (and icon image) per device.
+class DeviceLayer(JSCSSMixin, MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var locations = {{ this.locations }};
+            var classes = {{ this.classes }};
+            var deviceClasses = {{ this.device_classes }};
+            var tags = {{ this.tags }};
+            var tagNames = {{ this.tag_names }};
+            function tag(marker, i) {
+                return tags ? marker.bindTooltip(tagNames[tags[i]]) : marker;
+            }
+            {%- if this.mode == 'canvas' %}
+            var renderer = L.canvas({padding: 0.5});
+            var layer = L.layerGroup();
+            for (var i = 0; i < classes.length; i++) {
+                var deviceClass = deviceClasses[classes[i]];
+                tag(L.circleMarker([locations[2 * i], locations[2 * i + 1]], {
+                    renderer: renderer, radius: 3, weight: 1,
+                    color: deviceClass.color, fillColor: deviceClass.color, fillOpacity: 0.9
+                }), i).addTo(layer);
+            }
+            {%- else %}
+            var icons = deviceClasses.map(function(deviceClass) {
+                return L.icon({iconUrl: deviceClass.icon_url, iconSize: deviceClass.icon_size});
+            });
+            var markers = [];
+            for (var i = 0; i < classes.length; i++) {
+                markers.push(tag(L.marker([locations[2 * i], locations[2 * i + 1]], {icon: icons[classes[i]]}), i));
+            }
+            {%- if this.mode == 'cluster' %}
+            var layer = L.markerClusterGroup({chunkedLoading: true});
+            layer.addLayers(markers);
+            {%- else %}
+            var layer = L.layerGroup(markers);
+            {%- endif %}
+            {%- endif %}
+            return layer.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, devices, device_classes, mode=None, tags=None, tag_names=()):
+        super().__init__()
+        self._name = 'DeviceLayer'
+        devices = np.asarray(devices, dtype=np.float64).reshape(-1, 3)
+        self.mode = mode or pick_mode(len(devices))
+        self.locations, self.classes = encode_devices(devices)
+        self.tags = json.dumps(None if tags is None else np.asarray(tags, dtype=np.int64).tolist(),
+                               separators=(',', ':'))
+        self.tag_names = json.dumps(list(tag_names))
+        if self.mode == 'cluster':
+            self.default_js = MarkerCluster.default_js
+            self.default_css = MarkerCluster.default_css
+        # Icons are only needed (and embedded) when devices are drawn as markers
+        self.device_classes = json.dumps([
+            {
+                "icon_url": icon_url(device_class["icon"]) if self.mode != 'canvas' else None,
+                "icon_size": list(device_class.get("icon_size", (20, 20))),
+                "color": device_class.get("color", "#3388ff"),
+            }
+            for device_class in device_classes
+        ])
@@ -0,0 +1,205 @@
+import json
+import math
+import mmap
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Most worker processes the detector starts; each holds its own interpreter
+MAX_WORKERS = 4
+# Bytes read from each file, spread over evenly spaced blocks
+SAMPLE_BYTES = 64 * 1024
+BLOCK_SIZE = 4096
+# Files smaller than this don't give a reliable byte distribution
+MIN_FILE_SIZE = 4096
+# Encrypted data looks like uniformly random bytes. The main check is a
+# chi-square test of the byte histogram for uniformity: for random bytes the
+# statistic follows the same distribution (255 degrees of freedom, mean 255)
+# whatever the sample size. Compressed formats (zip, jpg, docx...) fail it
+# once the sample is large enough, which keeps them from being reported as
+# encrypted. The entropy check only drops samples far from 8 bits per byte.
+CHI_SQUARE_THRESHOLD = 350.0
+ENTROPY_THRESHOLD = 7.95
+
+
+# Function to get the offsets of the blocks sampled from a file of a given size
+def sample_offsets(size, sample_bytes=SAMPLE_BYTES, block_size=BLOCK_SIZE):
+    num_blocks = max(1, min(size // block_size, sample_bytes // block_size))
+    if num_blocks == 1:
+        return [0]
+    step = (size - block_size) / (num_blocks - 1)
+    return [int(i * step) for i in range(num_blocks)]
+
+
+def byte_histogram(path, sample_bytes=SAMPLE_BYTES, block_size=BLOCK_SIZE):
+    histogram = np.zeros(256, dtype=np.int64)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MIN_FILE_SIZE:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in sample_offsets(size, sample_bytes, block_size):
+                block = np.frombuffer(mapped[offset:offset + block_size], dtype=np.uint8)
+                histogram += np.bincount(block, minlength=256)
+    return histogram
+
+
+# Function to get the entropy threshold for a sample of a given size. The
+# entropy measured on n random bytes falls short of 8 bits by about
+# 255 / (2 n ln 2), 0.045 bits for a 4 KB sample, so the threshold is lowered
+# by as much.
+def entropy_threshold(sample_size):
+    return ENTROPY_THRESHOLD - 255 / (2 * sample_size * math.log(2))
+
+
+def entropy_and_chi_square(histogram):
+    total = histogram.sum()
+    probabilities = histogram[histogram > 0] / total
+    entropy = float(-(probabilities * np.log2(probabilities)).sum())
+    expected = total / 256
+    chi_square = float(((histogram - expected) ** 2 / expected).sum())
+    return entropy, chi_square
+
+
+# Function to check one file. Returns (path, is_encrypted, bytes_read); files
+# that can't be read or are too small are reported as not encrypted.
+def check_file(path, sample_bytes=SAMPLE_BYTES):
+    try:
+        histogram = byte_histogram(path, sample_bytes)
+    except (OSError, ValueError):
+        return path, False, 0
+    if histogram is None:
+        return path, False, 0
+    entropy, chi_square = entropy_and_chi_square(histogram)
+    sample_size = int(histogram.sum())
+    return path, chi_square <= CHI_SQUARE_THRESHOLD and entropy >= entropy_threshold(sample_size), sample_size
+
+
+def check_files(paths, sample_bytes):
+    return [check_file(path, sample_bytes) for path in paths]
+
+
+# Counter of files and bytes checked. The rate is that of the latest check,
+# measured over the wall time the check took.
+class ThroughputCounter:
+    def __init__(self):
+        self.last = (0, 0, 0.0)  # (files, bytes, seconds) of the latest check
+        self.total_files = 0
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, files, num_bytes, seconds):
+        with self._lock:
+            self.last = (files, num_bytes, seconds)
+            self.total_files += files
+            self.total_bytes += num_bytes
+
+    def rate(self):
+        with self._lock:
+            files, num_bytes, seconds = self.last
+            return {
+                "files_per_sec": files / seconds if seconds else 0.0,
+                "bytes_per_sec": num_bytes / seconds if seconds else 0.0,
+                "total_files": self.total_files,
+                "total_bytes": self.total_bytes,
+            }
+
+
+# Function to serve one worker process: reads batches as JSON lines on stdin,
+# {"paths": [...], "sample_bytes": n}, and writes each batch's results as one
+# JSON line on stdout
+def serve_worker():
+    for line in sys.stdin:
+        request = json.loads(line)
+        sys.stdout.write(json.dumps(check_files(request["paths"], request["sample_bytes"])) + "\n")
+        sys.stdout.flush()
+
+
+# Worker process that runs this file with the interpreter directly, so it only
+# imports this module and numpy. (A multiprocessing spawn or forkserver worker
+# first imports the parent's __main__, which in the dashboard is app.py.)
+class Worker:
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True)
+
+    def check_files(self, paths, sample_bytes):
+        self.process.stdin.write(json.dumps({"paths": paths, "sample_bytes": sample_bytes}) + "\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise OSError(f"Entropy worker exited with code {self.process.wait()}")
+        return json.loads(line)
+
+    def stop(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+# Detector that checks batches of files on worker processes, so entropy work
+# runs on several cores without holding the GIL of the dashboard process. Each
+# worker takes one batch at a time from a thread of the detector.
+class EncryptionDetector:
+    def __init__(self, processes=None, sample_bytes=SAMPLE_BYTES, batch_size=64):
+        self.processes = processes or min(MAX_WORKERS, os.cpu_count() or 1)
+        self.sample_bytes = sample_bytes
+        self.batch_size = batch_size
+        self.throughput = ThroughputCounter()
+        self._executor = None
+        self._workers = queue.Queue()
+
+    def executor(self):
+        if self._executor is None:
+            for _ in range(self.processes):
+                self._workers.put(Worker())
+            self._executor = ThreadPoolExecutor(self.processes, thread_name_prefix="entropy-worker")
+        return self._executor
+
+    # Function to check one batch on an idle worker. A worker that fails is
+    # replaced by a new one.
+    def check_batch(self, paths):
+        worker = self._workers.get()
+        try:
+            return worker.check_files(paths, self.sample_bytes)
+        except (OSError, ValueError):
+            worker.process.kill()
+            worker.process.wait()
+            worker = Worker()
+            raise
+        finally:
+            self._workers.put(worker)
+
+    # Function to check many files; returns the set of paths that look encrypted
+    def encrypted_files(self, paths):
+        paths = list(paths)
+        encrypted = set()
+        if not paths:
+            return encrypted
+        start = time.perf_counter()
+        bytes_read = 0
+        batches = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+        for results in self.executor().map(self.check_batch, batches):
+            for path, is_encrypted, num_bytes in results:
+                if is_encrypted:
+                    encrypted.add(path)
+                bytes_read += num_bytes
+        self.throughput.add(len(paths), bytes_read, time.perf_counter() - start)
+        return encrypted
+
+    def shutdown(self):
+        if self._executor is not None:
+            # Waits for the batches already running so every worker is idle
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+            while not self._workers.empty():
+                self._workers.get().stop()
+
+
+if __name__ == "__main__":
+    serve_worker()
@@ -0,0 +1,134 @@
+import bisect
+import contextlib
+import json
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: the log can only be shared by threads
+    fcntl = None
+
+# Seek index record: event time and the byte offset of its line in the log
+INDEX_RECORD = struct.Struct("<dQ")
+
+
+# Append-only log of scenario changes, one JSON line per change with the full
+# state after it, e.g.
+#   {"t":1715241600.0,"changed":["Weather"],"state":{"Navigation":"Online",...}}
+# A binary index next to it (<path>.idx) holds (time, offset) per line, so a
+# time range is found with a binary search and read from one seek. Several
+# processes may share the files: writes hold an exclusive lock on the log, and
+# each process picks up the others' entries before using its index.
+class EventLog:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.times = []
+        self.offsets = []
+        self._lock = threading.Lock()
+        with self.locked():
+            self.refresh()
+
+    # Exclusive lock on the log file across processes (where fcntl exists)
+    @contextlib.contextmanager
+    def locked(self):
+        with self._lock, open(self.path, 'ab') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Function to load index entries added since the last call, then index
+    # lines that were written to the log but not to the index (e.g. when a
+    # process stopped between the two writes). Call with the lock held.
+    def refresh(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r+b') as f:
+                f.seek(len(self.offsets) * INDEX_RECORD.size)
+                data = f.read()
+                usable = len(data) - len(data) % INDEX_RECORD.size
+                for timestamp, offset in INDEX_RECORD.iter_unpack(data[:usable]):
+                    self.times.append(timestamp)
+                    self.offsets.append(offset)
+                # Drop a half-written record
+                f.truncate(len(self.offsets) * INDEX_RECORD.size)
+
+        with open(self.path, 'rb') as f:
+            if self.offsets:
+                f.seek(self.offsets[-1])
+                f.readline()
+            position = f.tell()
+            records = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                records.append((json.loads(line)["t"], position))
+                position += len(line)
+        if records:
+            with open(self.index_path, 'ab') as f:
+                for timestamp, offset in records:
+                    f.write(INDEX_RECORD.pack(timestamp, offset))
+                    self.times.append(timestamp)
+                    self.offsets.append(offset)
+
+    def __len__(self):
+        with self.locked():
+            self.refresh()
+            return len(self.times)
+
+    # Function to append one change; timestamps must not go backwards
+    def append(self, timestamp, state, changed):
+        with self.locked():
+            self.refresh()
+            self._write(timestamp, state, changed)
+
+    # Function to start an empty log with the given state. The check and the
+    # write share one lock, so when several processes start on a new log only
+    # the first one writes the entry.
+    def seed_if_empty(self, timestamp, state):
+        with self.locked():
+            self.refresh()
+            if not self.times:
+                self._write(timestamp, state, [])
+
+    # Function to write one line and its index record. Call with the lock held,
+    # after refresh().
+    def _write(self, timestamp, state, changed):
+        timestamp = max(timestamp, self.times[-1]) if self.times else timestamp
+        line = json.dumps({"t": timestamp, "changed": list(changed), "state": state}, separators=(',', ':')) + "\n"
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write(line.encode("utf-8"))
+        with open(self.index_path, 'ab') as f:
+            f.write(INDEX_RECORD.pack(timestamp, offset))
+        self.times.append(timestamp)
+        self.offsets.append(offset)
+
+    # Function to get the time of the first and last event, or None
+    def bounds(self):
+        with self.locked():
+            self.refresh()
+            return (self.times[0], self.times[-1]) if self.times else None
+
+    # Function to read the events of a time range as (time, state) pairs. The
+    # first pair is the state in force at `start` (the last change before it).
+    def read_range(self, start, end):
+        with self.locked():
+            self.refresh()
+            first = max(bisect.bisect_right(self.times, start) - 1, 0)
+            last = bisect.bisect_right(self.times, end)
+            if first >= last:
+                return []
+            offset = self.offsets[first]
+        events = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for _ in range(last - first):
+                record = json.loads(f.readline())
+                events.append((max(record["t"], start), record["state"]))
+        return events
@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+NO_EXTENSION = "(none)"
+# Pie chart key for files that look encrypted
+ENCRYPTED = "SPIKE"
+# Pie charts show the largest extensions and fold the rest into "other"
+MAX_EXTENSIONS = 9
+
+
+# Function to read storage roots from the environment, e.g.
+#   ZELONIA_STORAGE_WEATHER=/srv/weather:/mnt/archive/weather
+def storage_roots_from_env(systems):
+    roots = {}
+    for system_name in systems:
+        value = os.environ.get(f"ZELONIA_STORAGE_{system_name.upper()}", "")
+        paths = [path for path in value.split(os.pathsep) if path]
+        if paths:
+            roots[system_name] = paths
+    return roots
+
+
+def file_extension(name):
+    extension = os.path.splitext(name)[1]
+    return extension[1:].lower() if extension else NO_EXTENSION
+
+
+# What one directory held directly when it was listed at `mtime_ns`: its files
+# per extension (encrypted files are counted under ENCRYPTED instead of their
+# extension), its subdirectories, and each file's (extension, size, mtime_ns,
+# encrypted) to compare the next listing against
+class DirectoryListing:
+    __slots__ = ("mtime_ns", "counts", "sizes", "subdirs", "files")
+
+    def __init__(self, mtime_ns, subdirs):
+        self.mtime_ns = mtime_ns
+        self.counts = {}
+        self.sizes = {}
+        self.subdirs = subdirs
+        self.files = {}
+
+    def add(self, path, extension, size, mtime_ns, encrypted=False):
+        self.files[path] = (extension, size, mtime_ns, encrypted)
+        key = ENCRYPTED if encrypted else extension
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.sizes[key] = self.sizes.get(key, 0) + size
+
+    def mark_encrypted(self, path):
+        extension, size, mtime_ns, _ = self.files[path]
+        self.files[path] = (extension, size, mtime_ns, True)
+        self.counts[extension] -= 1
+        self.sizes[extension] -= size
+        if not self.counts[extension]:
+            del self.counts[extension], self.sizes[extension]
+        self.counts[ENCRYPTED] = self.counts.get(ENCRYPTED, 0) + 1
+        self.sizes[ENCRYPTED] = self.sizes.get(ENCRYPTED, 0) + size
+
+
+# Function to list one directory with os.scandir. Files whose (mtime_ns, size)
+# match the previous listing keep its encryption result; the others are also
+# returned as paths to check for encryption.
+def list_directory(path, mtime_ns, previous=None):
+    subdirs, changed = [], []
+    listing = DirectoryListing(mtime_ns, subdirs)
+    known = previous.files if previous is not None else {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    extension = file_extension(entry.name)
+                    old = known.get(entry.path)
+                    if old is not None and old[1] == stat.st_size and old[2] == stat.st_mtime_ns:
+                        listing.add(entry.path, extension, stat.st_size, stat.st_mtime_ns, old[3])
+                    else:
+                        listing.add(entry.path, extension, stat.st_size, stat.st_mtime_ns)
+                        changed.append(entry.path)
+            except OSError:
+                continue
+    return listing, changed
+
+
+# Scanner that walks storage roots with a pool of os.scandir workers and keeps
+# an index of every directory keyed by its mtime. A regular scan only lists the
+# directories whose mtime changed (files added, removed or renamed); the others
+# cost one stat. A file edited in place leaves its directory's mtime alone, so
+# every `full_interval` seconds a full scan lists every directory and stats
+# every file. In both, only files that are new or whose mtime or size changed
+# are checked for encryption (with a detector); the others keep their result.
+class FileStorageScanner:
+    def __init__(self, roots, workers=8, interval=60.0, detector=None, full_interval=3600.0):
+        self.roots = roots
+        self.workers = workers
+        self.interval = interval
+        self.detector = detector
+        self.full_interval = full_interval
+        self.last_full_scan = None
+        self.index = {}
+        # Encryption check rate of each system's latest check
+        self.check_rates = {}
+        self.snapshot = {}
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Function to get a directory's listing, (path, listing, changed files,
+    # listed); an unchanged directory keeps its listing unless `full` is set
+    def visit(self, path, full):
+        try:
+            mtime_ns = os.stat(path, follow_symlinks=False).st_mtime_ns
+        except OSError:
+            return path, None, [], False
+        previous = self.index.get(path)
+        if not full and previous is not None and previous.mtime_ns == mtime_ns:
+            return path, previous, [], False
+        try:
+            return (path,) + list_directory(path, mtime_ns, previous) + (True,)
+        except OSError:
+            return path, None, [], False
+
+    # Function to scan the roots of one system, returning its histograms
+    def scan_system(self, roots, executor, full=False):
+        visited = {}
+        changed_files = []
+        listed = 0
+        level = list(roots)
+        while level:
+            next_level = []
+            for path, listing, changed, was_listed in executor.map(self.visit, level, [full] * len(level)):
+                if listing is None:
+                    continue
+                visited[path] = listing
+                next_level.extend(listing.subdirs)
+                listed += was_listed
+                changed_files.extend((listing, file_path) for file_path in changed)
+            level = next_level
+
+        if self.detector and changed_files:
+            encrypted = self.detector.encrypted_files(file_path for _, file_path in changed_files)
+            for listing, file_path in changed_files:
+                if file_path in encrypted:
+                    listing.mark_encrypted(file_path)
+
+        counts, sizes = {}, {}
+        for listing in visited.values():
+            for extension, count in listing.counts.items():
+                counts[extension] = counts.get(extension, 0) + count
+                sizes[extension] = sizes.get(extension, 0) + listing.sizes[extension]
+        return counts, sizes, visited, listed, len(changed_files)
+
+    # Function to scan every system once and publish the result as the new
+    # snapshot. The scan is a full one when `full_interval` has passed since
+    # the last full scan.
+    def scan(self):
+        snapshot = {}
+        index = {}
+        now = time.monotonic()
+        full = self.last_full_scan is None or now - self.last_full_scan >= self.full_interval
+        if full:
+            self.last_full_scan = now
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for system_name, roots in self.roots.items():
+                start = time.perf_counter()
+                counts, sizes, visited, listed, changed = self.scan_system(roots, executor, full)
+                index.update(visited)
+                snapshot[system_name] = {
+                    "by_count": counts,
+                    "by_bytes": sizes,
+                    "files": sum(counts.values()),
+                    "bytes": sum(sizes.values()),
+                    "directories": len(visited),
+                    "directories_listed": listed,
+                    "files_changed": changed,
+                    "full_scan": full,
+                    "seconds": time.perf_counter() - start,
+                    "finished": time.time(),
+                }
+                if self.detector and changed:
+                    self.check_rates[system_name] = self.detector.throughput.rate()
+                if system_name in self.check_rates:
+                    snapshot[system_name]["throughput"] = self.check_rates[system_name]
+        # Directories that disappeared drop out of the index here
+        self.index = index
+        with self._lock:
+            self.snapshot = snapshot
+        return snapshot
+
+    def latest(self, system_name):
+        with self._lock:
+            return self.snapshot.get(system_name)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"File storage scan failed: {e}")
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True, name="file-storage-scanner")
+        self._thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.detector:
+            self.detector.shutdown()
+
+
+# Function to turn a histogram into percentages for the pie charts, folding
+# the smallest extensions into "other"
+def to_percentages(histogram, max_extensions=MAX_EXTENSIONS):
+    total = sum(histogram.values())
+    if not total:
+        return {}
+    ranked = sorted(histogram.items(), key=lambda item: item[1], reverse=True)
+    percentages = {extension: round(100 * value / total, 1) for extension, value in ranked[:max_extensions]}
+    rest = sum(value for _, value in ranked[max_extensions:])
+    if rest:
+        percentages["other"] = round(100 * rest / total, 1)
+    return percentages
@@ -1,42 +1,355 @@
+import argparse
+import itertools
 import json
+import math
+import os
+import sys
+import time
 
-def offset_coordinates(geometry, offset_lon, offset_lat):
-    if geometry['type'] == 'Point':
-        lon, lat = geometry['coordinates']
-        geometry['coordinates'] = [lon + offset_lon, lat - offset_lat]
-    elif geometry['type'] == 'LineString' or geometry['type'] == 'MultiPoint':
-        for i, coords in enumerate(geometry['coordinates']):
-            lon, lat = coords
-            geometry['coordinates'][i] = [lon + offset_lon, lat - offset_lat]
-    elif geometry['type'] == 'Polygon' or geometry['type'] == 'MultiLineString':
-        for i, part in enumerate(geometry['coordinates']):
-            for j, coords in enumerate(part):
-                lon, lat = coords
-                geometry['coordinates'][i][j] = [lon + offset_lon, lat - offset_lat]
+import numpy as np
+
+POINT_TYPES = ('Point',)
+PART_TYPES = ('LineString', 'MultiPoint')
+PARTS_TYPES = ('Polygon', 'MultiLineString')
+
+# Characters read from the input at a time in streaming mode
+STREAM_CHUNK_SIZE = 1 << 20
+# Print streaming progress every this many features
+STREAM_PROGRESS_EVERY = 10000
+JSON_WHITESPACE = ' \t\n\r'
+
+
+# Function to collect every coordinate list (ring, line, point set) of a geometry.
+# Points are wrapped in a one-element list so every part looks the same.
+def geometry_parts(geometry, parts):
+    if geometry['type'] in POINT_TYPES:
+        parts.append([geometry['coordinates']])
+    elif geometry['type'] in PART_TYPES:
+        parts.append(geometry['coordinates'])
+    elif geometry['type'] in PARTS_TYPES:
+        parts.extend(geometry['coordinates'])
+    elif geometry['type'] == 'MultiPolygon':
+        for polygon in geometry['coordinates']:
+            parts.extend(polygon)
+    elif geometry['type'] == 'GeometryCollection':
+        for child in geometry['geometries']:
+            geometry_parts(child, parts)
+    return parts
+
+
+# Function to put transformed coordinate lists back into a geometry, in the
+# same order geometry_parts collected them
+def rebuild_geometry(geometry, parts):
+    if geometry['type'] in POINT_TYPES:
+        geometry['coordinates'] = next(parts)[0]
+    elif geometry['type'] in PART_TYPES:
+        geometry['coordinates'] = next(parts)
+    elif geometry['type'] in PARTS_TYPES:
+        geometry['coordinates'] = [next(parts) for _ in geometry['coordinates']]
     elif geometry['type'] == 'MultiPolygon':
-        for i, polygon in enumerate(geometry['coordinates']):
-            for j, part in enumerate(polygon):
-                for k, coords in enumerate(part):
-                    lon, lat = coords
-                    geometry['coordinates'][i][j][k] = [lon + offset_lon, lat - offset_lat]
+        geometry['coordinates'] = [[next(parts) for _ in polygon] for polygon in geometry['coordinates']]
+    elif geometry['type'] == 'GeometryCollection':
+        for child in geometry['geometries']:
+            rebuild_geometry(child, parts)
     return geometry
 
+
+def iter_geometries(data):
+    if data['type'] == 'FeatureCollection':
+        for feature in data['features']:
+            if feature.get('geometry'):
+                yield feature['geometry']
+    elif data['type'] == 'Feature':
+        if data.get('geometry'):
+            yield data['geometry']
+    else:
+        yield data
+
+
+# Function to flatten every ring of a GeoJSON object into one contiguous (N, 2)
+# array (N, 3 with altitudes), plus the offsets needed to split it back into rings
+def flatten_coordinates(geometries):
+    parts = []
+    for geometry in geometries:
+        geometry_parts(geometry, parts)
+    lengths = np.fromiter((len(part) for part in parts), dtype=np.int64, count=len(parts))
+    coords = np.array(list(itertools.chain.from_iterable(parts)), dtype=np.float64)
+    return coords.reshape(len(coords), -1) if len(coords) else coords.reshape(0, 2), np.cumsum(lengths)[:-1]
+
+
+# Affine transforms are 3x3 matrices acting on (lon, lat, 1) column vectors
+def offset_matrix(offset_lon, offset_lat):
+    return np.array([[1.0, 0.0, offset_lon], [0.0, 1.0, offset_lat], [0.0, 0.0, 1.0]])
+
+
+def about_origin(matrix, origin):
+    return offset_matrix(*origin) @ matrix @ offset_matrix(-origin[0], -origin[1])
+
+
+def scale_matrix(scale_lon, scale_lat, origin=(0.0, 0.0)):
+    return about_origin(np.diag([scale_lon, scale_lat, 1.0]), origin)
+
+
+def rotate_matrix(degrees, origin=(0.0, 0.0)):
+    angle = math.radians(degrees)
+    cos, sin = math.cos(angle), math.sin(angle)
+    return about_origin(np.array([[cos, -sin, 0.0], [sin, cos, 0.0], [0.0, 0.0, 1.0]]), origin)
+
+
+# Mirror across the vertical ('lon') or horizontal ('lat') line through the origin
+def mirror_matrix(axis, origin=(0.0, 0.0)):
+    if axis == 'lon':
+        return scale_matrix(-1.0, 1.0, origin)
+    elif axis == 'lat':
+        return scale_matrix(1.0, -1.0, origin)
+    raise ValueError(f"Unknown mirror axis: {axis}")
+
+
+# Only lon/lat are transformed; altitudes are left as they are
+def apply_affine(coords, matrix):
+    coords = coords.copy()
+    coords[:, :2] = coords[:, :2] @ matrix[:2, :2].T + matrix[:2, 2]
+    return coords
+
+
+# Function to apply an affine transform to every geometry of a GeoJSON object
+# in one vectorized pass, optionally rounding the result to a number of decimals.
+# The object is modified in place and returned.
+def transform_geojson(data, matrix, decimals=None):
+    geometries = list(iter_geometries(data))
+    coords, splits = flatten_coordinates(geometries)
+    coords = apply_affine(coords, matrix)
+    if decimals is not None:
+        coords = coords.round(decimals)
+    parts = iter(part.tolist() for part in np.split(coords, splits))
+    for geometry in geometries:
+        rebuild_geometry(geometry, parts)
+    return data
+
+
+def bounding_box_center(data):
+    coords, _ = flatten_coordinates(list(iter_geometries(data)))
+    return tuple((coords[:, :2].min(axis=0) + coords[:, :2].max(axis=0)) / 2)
+
+
+# Incremental JSON reader: decodes one value at a time from a file, keeping only
+# the undecoded part of the input in memory
+class JsonStreamReader:
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    # Drop what was already consumed and read until min_size characters are buffered
+    def fill(self, min_size):
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        while len(self.buffer) < min_size and not self.eof:
+            chunk = self.f.read(max(self.chunk_size, min_size - len(self.buffer)))
+            self.eof = not chunk
+            self.buffer += chunk
+
+    # Next non-whitespace character, without consuming it ('' at end of file)
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill(self.chunk_size)
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in {self.f.name}, found {found!r}")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number that ends the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Value is incomplete: read twice as much more and decode it again
+            size *= 2
+            self.fill(len(self.buffer) - self.pos + size)
+
+
+# Function to read a GeoJSON file as a stream of events:
+#   ('member', key, value) for top-level members other than "features",
+#   ('features', None, None) and ('features_end', None, None) around the array,
+#   ('feature', None, feature) for each feature as soon as it is read.
+def iter_geojson_stream(f):
+    reader = JsonStreamReader(f)
+    reader.expect('{')
+    first = True
+    while reader.peek() != '}':
+        if not first:
+            reader.expect(',')
+        first = False
+        key = reader.decode()
+        reader.expect(':')
+        if key != 'features':
+            yield 'member', key, reader.decode()
+            continue
+        yield 'features', None, None
+        reader.expect('[')
+        first_feature = True
+        while reader.peek() != ']':
+            if not first_feature:
+                reader.expect(',')
+            first_feature = False
+            yield 'feature', None, reader.decode()
+        reader.expect(']')
+        yield 'features_end', None, None
+    reader.expect('}')
+
+
+# Function to find the bounding box centre of a file in streaming mode
+def stream_bounding_box_center(input_file):
+    low, high = np.full(2, np.inf), np.full(2, -np.inf)
+    members = {}
+    is_collection = False
+    with open(input_file, 'r') as f:
+        for event, key, value in iter_geojson_stream(f):
+            if event == 'member':
+                members[key] = value
+            elif event == 'features':
+                is_collection = True
+            elif event == 'feature' and value.get('geometry'):
+                coords, _ = flatten_coordinates([value['geometry']])
+                if len(coords):
+                    low = np.minimum(low, coords[:, :2].min(axis=0))
+                    high = np.maximum(high, coords[:, :2].max(axis=0))
+    if not is_collection:
+        # A single Feature or geometry was read whole as top-level members
+        return bounding_box_center(members)
+    return tuple((low + high) / 2)
+
+
+# Function to transform a GeoJSON file feature by feature, writing each one out
+# as soon as it is transformed. Memory stays bounded by the largest feature.
+# Returns the number of features written and the time it took.
+def stream_transform_geojson(input_file, output_file, matrix, decimals=None, progress=None):
+    start = time.perf_counter()
+    count = 0
+    members = {}
+    in_features = after_features = False
+    with open(input_file, 'r') as f_in, open(output_file, 'w') as f_out:
+        for event, key, value in iter_geojson_stream(f_in):
+            if event == 'member' and after_features:
+                f_out.write(', ' + json.dumps(key) + ': ' + json.dumps(value))
+            elif event == 'member':
+                members[key] = value
+            elif event == 'features':
+                header = json.dumps(members)[:-1]
+                f_out.write(header + (', ' if members else '') + '"features": [')
+                in_features = True
+            elif event == 'feature':
+                f_out.write((', ' if count else '') + json.dumps(transform_geojson(value, matrix, decimals)))
+                count += 1
+                if progress and count % STREAM_PROGRESS_EVERY == 0:
+                    progress(count, time.perf_counter() - start)
+            elif event == 'features_end':
+                f_out.write(']')
+                after_features = True
+        if in_features:
+            f_out.write('}')
+        else:
+            # A single Feature or geometry has nothing to stream
+            json.dump(transform_geojson(members, matrix, decimals), f_out)
+    return count, time.perf_counter() - start
+
+
+def offset_coordinates(geometry, offset_lon, offset_lat):
+    return transform_geojson(geometry, offset_matrix(offset_lon, -offset_lat))
+
+
 def offset_geojson(input_file, output_file, offset_lon, offset_lat):
     with open(input_file, 'r') as f:
         data = json.load(f)
 
-    if 'features' in data:
-        for feature in data['features']:
-            feature['geometry'] = offset_coordinates(feature['geometry'], offset_lon, offset_lat)
-    elif 'geometry' in data:
-        data['geometry'] = offset_coordinates(data['geometry'], offset_lon, offset_lat)
+    transform_geojson(data, offset_matrix(offset_lon, -offset_lat))
 
     with open(output_file, 'w') as f:
         json.dump(data, f)
 
-# Example usage:
-input_file = 'data/Geojsons/singapore-boundary.geojson'  #Source
-output_file = 'data/Geojsons/output.geojson' #Destination
-offset_lon = 120
-offset_lat = -5
-offset_geojson(input_file, output_file, offset_lon, offset_lat)
+
+# Function to build one matrix from the command line options. Mirror, scale and
+# rotate happen around the centre of the input's bounding box, then the offset.
+# find_center is only called when the centre is needed.
+def build_matrix(args, find_center):
+    matrix = np.identity(3)
+    if args.mirror or args.scale or args.rotate:
+        origin = find_center()
+    if args.mirror:
+        matrix = mirror_matrix(args.mirror, origin) @ matrix
+    if args.scale:
+        matrix = scale_matrix(args.scale[0], args.scale[1], origin) @ matrix
+    if args.rotate:
+        matrix = rotate_matrix(args.rotate, origin) @ matrix
+    if args.offset:
+        matrix = offset_matrix(args.offset[0], args.offset[1]) @ matrix
+    return matrix
+
+
+def output_path(args, input_file):
+    if args.output:
+        return args.output
+    name, extension = os.path.splitext(os.path.basename(input_file))
+    return os.path.join(args.output_dir or os.path.dirname(input_file), f"{name}{args.suffix}{extension}")
+
+
+def report_progress(count, elapsed):
+    print(f"  {count} features ({count / max(elapsed, 1e-9):.0f} features/sec)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate new fictional countries by transforming GeoJSON boundaries")
+    parser.add_argument("inputs", nargs="+", help="GeoJSON files to transform")
+    parser.add_argument("-o", "--output", help="Output file (only with a single input)")
+    parser.add_argument("--output-dir", help="Directory for the outputs (default: next to each input)")
+    parser.add_argument("--suffix", default="-transformed", help="Added to each output file name (default: %(default)s)")
+    parser.add_argument("--offset", nargs=2, type=float, metavar=("LON", "LAT"), help="Degrees added to every coordinate")
+    parser.add_argument("--scale", nargs=2, type=float, metavar=("LON", "LAT"), help="Scale factors")
+    parser.add_argument("--rotate", type=float, metavar="DEGREES", help="Counter-clockwise rotation")
+    parser.add_argument("--mirror", choices=("lon", "lat"), help="Flip east-west ('lon') or north-south ('lat')")
+    parser.add_argument("--precision", type=int, metavar="DECIMALS", help="Round output coordinates to this many decimals")
+    parser.add_argument("--stream", action="store_true", help="Transform one feature at a time to keep memory bounded")
+    args = parser.parse_args()
+
+    if args.output and len(args.inputs) > 1:
+        parser.error("--output can only be used with a single input; use --output-dir instead")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    for input_file in args.inputs:
+        output_file = output_path(args, input_file)
+        if args.stream:
+            matrix = build_matrix(args, lambda: stream_bounding_box_center(input_file))
+            count, elapsed = stream_transform_geojson(input_file, output_file, matrix, args.precision, report_progress)
+            print(f"{input_file} -> {output_file}: {count} features in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} features/sec)")
+            continue
+        with open(input_file, 'r') as f:
+            data = json.load(f)
+        transform_geojson(data, build_matrix(args, lambda: bounding_box_center(data)), args.precision)
+        with open(output_file, 'w') as f:
+            json.dump(data, f)
+        print(f"{input_file} -> {output_file}")
+
+
+# Example usage (how Zelonia.geojson was made from the Singapore boundary):
+#   python generate_new_geojson.py data/Geojsons/singapore-boundary.geojson \
+#       -o data/Geojsons/output.geojson --offset 120 5
+if __name__ == "__main__":
+    main()
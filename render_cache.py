@@ -0,0 +1,106 @@
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
+SYSTEM_STATUSES = ["Online", "Isolated", "Offline"]
+
+
+# Function to build a canonical, hashable fingerprint of the scenario state
+def state_fingerprint(admin_controls, attack_server_found):
+    return tuple(sorted(admin_controls.items())) + (("attack_server_found", bool(attack_server_found)),)
+
+
+# Function to turn a fingerprint into a seed that is the same in every process
+def state_seed(fingerprint):
+    digest = hashlib.sha1(repr(fingerprint).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+# Function to list every scenario state of the given systems (3 statuses for
+# 3 systems x attack flag = 54)
+def all_states(system_names):
+    for statuses in itertools.product(SYSTEM_STATUSES, repeat=len(system_names)):
+        for attack_server_found in (False, True):
+            yield dict(zip(system_names, statuses)), attack_server_found
+
+
+# Thread-safe LRU cache of rendered HTML, bounded by the total size in bytes
+class RenderCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._rendering = {}  # Key -> Event set when its render finishes
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, html):
+        size = len(html.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (html, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    # Rendering happens outside the lock so a slow build never blocks other
+    # keys. Sessions asking for a key that is being rendered wait for that
+    # render instead of repeating it, so a change seen by every viewer at once
+    # is rendered once.
+    def get_or_render(self, key, render):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            rendering = self._rendering.get(key)
+            if rendering is None:
+                self.misses += 1
+                done = self._rendering[key] = threading.Event()
+        if rendering is not None:
+            rendering.wait()
+            # Not cached if the render failed or was too large: render it here
+            return self.get(key) or render()
+        try:
+            html = render()
+            self.put(key, html)
+            return html
+        finally:
+            with self._lock:
+                del self._rendering[key]
+            done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.current_bytes,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,202 @@
+import json
+import sqlite3
+import threading
+
+ATTACK_SERVER_FOUND = "attack_server_found"
+
+
+# Function to get the state an exercise starts in: every system (named as in
+# the topology) online and no attack server found
+def default_state(system_names):
+    return {**{name: "Online" for name in system_names}, ATTACK_SERVER_FOUND: False}
+
+
+# Shared scenario state (system statuses and the attack flag) with a version
+# counter, kept in this process (the default backend). Every update that
+# changes something bumps the version, and each key remembers the version it
+# last changed at, so a viewer can tell whether the part it draws is out of
+# date. Subscribers are called after every change.
+class ScenarioState:
+    def __init__(self, initial):
+        self._values = dict(initial)
+        self._key_versions = {key: 0 for key in initial}
+        self._version = 0
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        with self._lock:
+            return self._version
+
+    def get(self, key):
+        with self._lock:
+            return self._values[key]
+
+    # Function to get a consistent copy of the state and its version
+    def snapshot(self):
+        with self._lock:
+            return self._version, dict(self._values)
+
+    # Function to get the version at which any of the given keys last changed
+    def version_of(self, keys):
+        with self._lock:
+            return max(self._key_versions[key] for key in keys)
+
+    # Function to apply several changes at once; returns the changed keys
+    def update(self, changes):
+        with self._lock:
+            changed = [key for key, value in changes.items() if self._values.get(key) != value]
+            if not changed:
+                return []
+            self._version += 1
+            for key in changed:
+                self._values[key] = changes[key]
+                self._key_versions[key] = self._version
+            version = self._version
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(version, changed)
+        return changed
+
+    # Function to register callback(version, changed_keys); returns a function
+    # that removes it again
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+
+# Scenario state kept in an SQLite database in WAL mode, so every Streamlit
+# process on the machine shares it: readers never block the writer, and an
+# update is one short transaction. A watcher thread polls the cheap
+# `PRAGMA data_version` and calls subscribers for changes made by any process.
+class SqliteScenarioState:
+    def __init__(self, path, initial, poll_interval=0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        # One connection shared by every thread, its calls serialized by a lock.
+        # Streamlit runs each rerun on a new thread, so a connection per thread
+        # would be opened (and set up) again for nearly every poll
+        self._connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection_lock = threading.Lock()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._seen_versions = {}
+        self.stopped = threading.Event()
+
+        connection = self._connection
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS scenario (key TEXT PRIMARY KEY, value TEXT, version INTEGER)")
+            connection.executemany("INSERT OR IGNORE INTO scenario VALUES (?, ?, 0)",
+                                   [(key, json.dumps(value)) for key, value in initial.items()])
+        self._seen_versions = {key: version for key, (_, version) in self.read().items()}
+        threading.Thread(target=self.watch, daemon=True, name="scenario-state-watcher").start()
+
+    # Function to run one statement on the shared connection and fetch its rows
+    def query(self, sql, parameters=()):
+        with self._connection_lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    # Function to read every key as {key: (value, version)}. `rows` are the
+    # table's rows when the caller already holds the connection lock
+    def read(self, rows=None):
+        if rows is None:
+            rows = self.query("SELECT key, value, version FROM scenario")
+        return {key: (json.loads(value), version) for key, value, version in rows}
+
+    @property
+    def version(self):
+        return max(version for _, version in self.read().values())
+
+    def get(self, key):
+        rows = self.query("SELECT value FROM scenario WHERE key = ?", (key,))
+        if not rows:
+            raise KeyError(key)
+        return json.loads(rows[0][0])
+
+    def snapshot(self):
+        rows = self.read()
+        return max(version for _, version in rows.values()), {key: value for key, (value, _) in rows.items()}
+
+    def version_of(self, keys):
+        rows = self.read()
+        return max(rows[key][1] for key in keys)
+
+    def update(self, changes):
+        with self._connection_lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.read(connection.execute("SELECT key, value, version FROM scenario").fetchall())
+                changed = [key for key, value in changes.items() if key not in rows or rows[key][0] != value]
+                if changed:
+                    version = max(version for _, version in rows.values()) + 1
+                    connection.executemany("INSERT INTO scenario VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE "
+                                           "SET value = excluded.value, version = excluded.version",
+                                           [(key, json.dumps(changes[key]), version) for key in changed])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        if changed:
+            self.check_for_changes()
+        return changed
+
+    # Function to notify subscribers about every change (from any process)
+    # that this process hasn't reported yet
+    def check_for_changes(self):
+        with self._lock:
+            rows = self.read()
+            changed = [key for key, (_, version) in rows.items() if version > self._seen_versions.get(key, -1)]
+            if not changed:
+                return
+            self._seen_versions = {key: version for key, (_, version) in rows.items()}
+            version = max(self._seen_versions.values())
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(version, changed)
+
+    def watch(self):
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        data_version = None
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                current = connection.execute("PRAGMA data_version").fetchone()[0]
+                if current != data_version:
+                    data_version = current
+                    self.check_for_changes()
+            except sqlite3.Error as e:
+                print(f"Scenario state poll failed: {e}")
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def stop(self):
+        self.stopped.set()
+
+
+# Function to create the state backend from a spec: "memory" (one process)
+# or "sqlite:<path>" (shared by every process that opens the same file).
+# `initial` is used for keys the backend doesn't hold yet.
+def create_state(spec, initial):
+    kind, _, target = spec.partition(":")
+    if kind == "memory":
+        return ScenarioState(initial)
+    elif kind == "sqlite":
+        return SqliteScenarioState(target, initial)
+    raise ValueError(f"Unknown scenario state backend: {spec}")
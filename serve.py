@@ -0,0 +1,47 @@
+import gc
+import os
+import sys
+import time
+
+# Taken before any heavy import so the cold-start time covers them
+PROCESS_START = time.time()
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+WARM_UP_TIMEOUT = 600  # Seconds the warm-up may take before start-up fails
+# Passed to `streamlit run` ahead of the caller's own options. A served
+# dashboard doesn't reload edited code, and watching the sources would cost
+# every session a scan of all loaded modules after each script run. Streamlit
+# also runs a full garbage collection after each script run, including each
+# session's poll every second; with 30 viewers that took most of the server's
+# CPU (benchmarks/load_viewers.py). Python's own collector still runs.
+STREAMLIT_OPTIONS = ["--server.fileWatcherType", "none", "--runner.postScriptGC", "false"]
+
+
+# Function to warm the dashboard up in this process, then start the Streamlit
+# server on it. The warm-up is one headless run of app.py, so it fills the
+# same shared caches the sessions use and the first viewer gets maps that are
+# already rendered. Extra arguments are passed to `streamlit run`, e.g.
+# `python serve.py --server.port 8501`.
+def main():
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["ZELONIA_PROCESS_START"] = str(PROCESS_START)
+    os.environ["ZELONIA_WARM_UP_ONLY"] = "1"
+    try:
+        warm_up = AppTest.from_file(APP_FILE, default_timeout=WARM_UP_TIMEOUT).run()
+    finally:
+        del os.environ["ZELONIA_WARM_UP_ONLY"]
+    if warm_up.exception:
+        sys.exit(f"Warm-up failed: {warm_up.exception[0].message}")
+    # What the warm-up loaded lives as long as the process. Freezing it keeps
+    # Python's full collections from going through it all each time.
+    gc.collect()
+    gc.freeze()
+
+    from streamlit.web import cli
+    sys.argv = ["streamlit", "run", APP_FILE, *STREAMLIT_OPTIONS, *sys.argv[1:]]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import json
+import math
+import os
+
+GEOJSON_DIR = "data/Geojsons"
+SIMPLIFIED_DIR = os.path.join(GEOJSON_DIR, "simplified")
+
+# Zoom levels we precompute a simplified boundary for. Each level drops detail
+# smaller than half a screen pixel at that zoom, so the coastline looks the same.
+ZOOM_LEVELS = (6, 8, 10, 12, 14)
+
+
+def tolerance_for_zoom(zoom):
+    # Degrees per pixel on a 256px web mercator tile, halved
+    return 360.0 / (256 * 2 ** zoom) / 2
+
+
+def precision_for_zoom(zoom):
+    # Enough decimals to keep rounding error well below the tolerance
+    return max(0, int(math.ceil(-math.log10(tolerance_for_zoom(zoom) / 4))))
+
+
+def simplified_path(name, zoom, extension="geojson"):
+    return os.path.join(SIMPLIFIED_DIR, f"{name}.z{zoom}.{extension}")
+
+
+# Function to get all polygon rings of a geometry as lists of (lon, lat) tuples
+def geometry_rings(geometry):
+    if geometry['type'] == 'Polygon':
+        return [[tuple(c) for c in ring] for ring in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        return [[tuple(c) for c in ring] for polygon in geometry['coordinates'] for ring in polygon]
+    return []
+
+
+def iter_geometries(data):
+    if data['type'] == 'FeatureCollection':
+        for feature in data['features']:
+            yield feature['geometry']
+    elif data['type'] == 'Feature':
+        yield data['geometry']
+    else:
+        yield data
+
+
+# Function to find junctions: points where rings stop sharing the same boundary
+def find_junctions(rings):
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        points = ring[:-1]
+        for i, point in enumerate(points):
+            pair = frozenset((points[i - 1], points[(i + 1) % len(points)]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+# Function to split rings into arcs at junctions, sharing arcs between rings.
+# Returns the list of arcs and, per ring, its arc indexes (~index = reversed).
+def build_arcs(rings):
+    junctions = find_junctions(rings)
+    arcs = []
+    arc_index = {}
+
+    def add_arc(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reverse_key = key[::-1]
+        if reverse_key in arc_index:
+            return ~arc_index[reverse_key]
+        arc_index[key] = len(arcs)
+        arcs.append(list(arc))
+        return arc_index[key]
+
+    ring_arcs = []
+    for ring in rings:
+        points = ring[:-1]
+        cuts = [i for i, point in enumerate(points) if point in junctions]
+        if not cuts:
+            # Closed arc: start at the smallest point so identical rings match
+            start = points.index(min(points))
+            points = points[start:] + points[:start]
+            ring_arcs.append([add_arc(points + [points[0]])])
+            continue
+        # Rotate the ring to start at a junction and cut it at every junction
+        points = points[cuts[0]:] + points[:cuts[0]]
+        cuts = [i - cuts[0] for i in cuts]
+        cuts.append(len(points))
+        points.append(points[0])
+        ring_arcs.append([add_arc(points[a:b + 1]) for a, b in zip(cuts, cuts[1:])])
+    return arcs, ring_arcs
+
+
+def point_segment_distance(point, start, end):
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(point[0] - start[0], point[1] - start[1])
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+# Douglas-Peucker simplification of one arc, always keeping both end points
+def simplify_arc(arc, tolerance):
+    if len(arc) < 3:
+        return list(arc)
+    keep = [False] * len(arc)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(arc) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance, index = 0.0, None
+        for i in range(first + 1, last):
+            distance = point_segment_distance(arc[i], arc[first], arc[last])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(arc, keep) if kept]
+
+
+def quantize_arc(arc, decimals):
+    quantized = []
+    for lon, lat in arc:
+        point = (round(lon, decimals), round(lat, decimals))
+        if not quantized or quantized[-1] != point:
+            quantized.append(point)
+    return quantized
+
+
+def ring_from_arcs(arcs, indexes):
+    ring = []
+    for index in indexes:
+        arc = arcs[index] if index >= 0 else arcs[~index][::-1]
+        ring.extend(arc if not ring else arc[1:])
+    return ring
+
+
+# Function to rebuild a geometry from simplified rings, dropping any ring
+# that collapsed below a valid polygon (sub-pixel islands and holes)
+def rebuild_geometry(geometry, rings):
+    rings = iter(rings)
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    new_polygons = []
+    for polygon in polygons:
+        new_rings = [next(rings) for _ in polygon]
+        if len(new_rings[0]) < 4:
+            continue
+        new_polygons.append([[list(p) for p in ring] for ring in new_rings if len(ring) >= 4])
+    if geometry['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': new_polygons[0] if new_polygons else []}
+    return {'type': 'MultiPolygon', 'coordinates': new_polygons}
+
+
+# Function to simplify every polygon in a GeoJSON object for a given zoom level
+def simplify_geojson(data, zoom):
+    geometries = list(iter_geometries(data))
+    rings_per_geometry = [geometry_rings(geometry) for geometry in geometries]
+    all_rings = [ring for rings in rings_per_geometry for ring in rings]
+
+    arcs, ring_arcs = build_arcs(all_rings)
+    tolerance, decimals = tolerance_for_zoom(zoom), precision_for_zoom(zoom)
+    # Each shared arc is simplified once, so neighbouring rings stay glued together
+    arcs = [quantize_arc(simplify_arc(arc, tolerance), decimals) for arc in arcs]
+    new_rings = iter([ring_from_arcs(arcs, indexes) for indexes in ring_arcs])
+
+    simplified = []
+    for geometry, rings in zip(geometries, rings_per_geometry):
+        if rings:
+            simplified.append(rebuild_geometry(geometry, [next(new_rings) for _ in rings]))
+        else:
+            simplified.append(geometry)
+
+    if data['type'] == 'FeatureCollection':
+        features = [dict(feature, geometry=geometry) for feature, geometry in zip(data['features'], simplified)]
+        return dict(data, features=features)
+    elif data['type'] == 'Feature':
+        return dict(data, geometry=simplified[0])
+    return simplified[0]
+
+
+# Function to convert a GeoJSON object to TopoJSON with shared, delta-encoded arcs
+def to_topojson(data, zoom, object_name):
+    geometries = list(iter_geometries(data))
+    features = data['features'] if data['type'] == 'FeatureCollection' else [data]
+    rings_per_geometry = [geometry_rings(geometry) for geometry in geometries]
+    arcs, ring_arcs = build_arcs([ring for rings in rings_per_geometry for ring in rings])
+    tolerance = tolerance_for_zoom(zoom)
+    arcs = [simplify_arc(arc, tolerance) for arc in arcs]
+
+    points = [point for arc in arcs for point in arc]
+    min_lon = min(p[0] for p in points)
+    min_lat = min(p[1] for p in points)
+    max_lon = max(p[0] for p in points)
+    max_lat = max(p[1] for p in points)
+    # Integer grid a quarter of the tolerance wide, same as the GeoJSON rounding
+    scale = [tolerance / 4, tolerance / 4]
+
+    encoded_arcs = []
+    for arc in arcs:
+        encoded, previous = [], (0, 0)
+        for lon, lat in arc:
+            x = int(round((lon - min_lon) / scale[0]))
+            y = int(round((lat - min_lat) / scale[1]))
+            if encoded and (x, y) == previous:
+                continue
+            encoded.append([x - previous[0], y - previous[1]])
+            previous = (x, y)
+        if len(encoded) == 1:
+            encoded.append([0, 0])
+        encoded_arcs.append(encoded)
+
+    ring_arcs = iter(ring_arcs)
+    topo_geometries = []
+    for geometry, feature in zip(geometries, features):
+        entry = {'type': geometry['type'], 'properties': feature.get('properties', {})}
+        if geometry['type'] == 'Polygon':
+            entry['arcs'] = [next(ring_arcs) for _ in geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            entry['arcs'] = [[next(ring_arcs) for _ in polygon] for polygon in geometry['coordinates']]
+        else:
+            entry = dict(geometry, properties=entry['properties'])
+        topo_geometries.append(entry)
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': scale, 'translate': [min_lon, min_lat]},
+        'bbox': [min_lon, min_lat, max_lon, max_lat],
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': topo_geometries}},
+        'arcs': encoded_arcs,
+    }
+
+
+# Function to write every simplified zoom level of one boundary file
+def precompute_boundary(input_file, zoom_levels=ZOOM_LEVELS, topojson=False):
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    with open(input_file, 'r') as f:
+        data = json.load(f)
+
+    os.makedirs(SIMPLIFIED_DIR, exist_ok=True)
+    written = []
+    for zoom in zoom_levels:
+        output_file = simplified_path(name, zoom)
+        with open(output_file, 'w') as f:
+            json.dump(simplify_geojson(data, zoom), f, separators=(',', ':'))
+        written.append(output_file)
+        if topojson:
+            output_file = simplified_path(name, zoom, "topojson")
+            with open(output_file, 'w') as f:
+                json.dump(to_topojson(data, zoom, name), f, separators=(',', ':'))
+            written.append(output_file)
+    return written
+
+
+# Function to load the boundary that matches a map zoom. Uses the coarsest
+# precomputed level that is still detailed enough, or the original file
+# (always the original without a zoom).
+def load_boundary(name, zoom=None):
+    for level in ZOOM_LEVELS if zoom is not None else ():
+        if level >= zoom and os.path.exists(simplified_path(name, level)):
+            path = simplified_path(name, level)
+            break
+    else:
+        path = os.path.join(GEOJSON_DIR, f"{name}.geojson")
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute simplified boundary files for each map zoom level")
+    parser.add_argument("inputs", nargs="*", help="GeoJSON files (default: the map boundaries)")
+    parser.add_argument("--zoom", type=int, action="append", help="Zoom level to precompute (repeatable)")
+    parser.add_argument("--topojson", action="store_true", help="Also write TopoJSON with shared arcs")
+    args = parser.parse_args()
+
+    inputs = args.inputs or [os.path.join(GEOJSON_DIR, "Zelonia.geojson"), os.path.join(GEOJSON_DIR, "Putonia.geojson")]
+    for input_file in inputs:
+        for output_file in precompute_boundary(input_file, tuple(args.zoom or ZOOM_LEVELS), args.topojson):
+            print(f"{output_file}: {os.path.getsize(output_file)} bytes")
+
+
+if __name__ == "__main__":
+    main()
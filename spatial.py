@@ -0,0 +1,127 @@
+import math
+
+import numpy as np
+
+# Rows of the boundary grid; each row keeps the polygon edges that cross it
+GRID_ROWS = 512
+# Queries are processed in chunks so the candidate matrices stay small
+CHUNK_SIZE = 4096
+
+
+def iter_polygon_rings(data):
+    if data['type'] == 'FeatureCollection':
+        for feature in data['features']:
+            yield from iter_polygon_rings(feature)
+    elif data['type'] == 'Feature':
+        if data.get('geometry'):
+            yield from iter_polygon_rings(data['geometry'])
+    elif data['type'] == 'Polygon':
+        yield from data['coordinates']
+    elif data['type'] == 'MultiPolygon':
+        for polygon in data['coordinates']:
+            yield from polygon
+
+
+# Point-in-polygon index over every polygon of a GeoJSON object. Edges are
+# bucketed into horizontal grid rows, and contains() casts a ray from each
+# point through the edges of its row only (even-odd rule, so holes work).
+class BoundaryIndex:
+    def __init__(self, data, rows=GRID_ROWS):
+        starts, ends = [], []
+        for ring in iter_polygon_rings(data):
+            ring = np.asarray(ring, dtype=np.float64)[:, :2]
+            starts.append(ring[:-1])
+            ends.append(ring[1:])
+        starts, ends = np.concatenate(starts), np.concatenate(ends)
+        # Horizontal edges never cross a horizontal ray
+        keep = starts[:, 1] != ends[:, 1]
+        self.x1, self.y1 = starts[keep, 0], starts[keep, 1]
+        self.x2, self.y2 = ends[keep, 0], ends[keep, 1]
+
+        self.min_lon, self.max_lon = min(self.x1.min(), self.x2.min()), max(self.x1.max(), self.x2.max())
+        self.min_lat, self.max_lat = min(self.y1.min(), self.y2.min()), max(self.y1.max(), self.y2.max())
+        self.rows = rows
+        self.row_height = (self.max_lat - self.min_lat) / rows or 1.0
+
+        # Edge ids of every row, stored back to back with offsets per row
+        low = self.row_of(np.minimum(self.y1, self.y2))
+        high = self.row_of(np.maximum(self.y1, self.y2))
+        spans = high - low + 1
+        edge_ids = np.repeat(np.arange(len(low)), spans)
+        row_ids = np.repeat(low, spans) + (np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans))
+        order = np.argsort(row_ids, kind='stable')
+        self.row_edges = edge_ids[order]
+        self.row_offsets = np.searchsorted(row_ids[order], np.arange(rows + 1))
+
+    def row_of(self, lats):
+        return np.clip(((lats - self.min_lat) / self.row_height).astype(np.int64), 0, self.rows - 1)
+
+    # Function to test many points at once; returns a boolean array
+    def contains(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        inside = np.zeros(lats.shape, dtype=bool)
+        candidates = np.flatnonzero((lats >= self.min_lat) & (lats <= self.max_lat) &
+                                    (lons >= self.min_lon) & (lons <= self.max_lon))
+        if not len(candidates):
+            return inside
+        rows = self.row_of(lats[candidates])
+        order = np.argsort(rows, kind='stable')
+        candidates, rows = candidates[order], rows[order]
+        bounds = np.searchsorted(rows, np.arange(self.rows + 1))
+
+        for row in np.flatnonzero(np.diff(bounds)):
+            edges = self.row_edges[self.row_offsets[row]:self.row_offsets[row + 1]]
+            if not len(edges):
+                continue
+            x1, y1, x2, y2 = self.x1[edges], self.y1[edges], self.x2[edges], self.y2[edges]
+            # Keep points x edges under CHUNK_SIZE * CHUNK_SIZE / 16 cells
+            step = max(1, CHUNK_SIZE * CHUNK_SIZE // 16 // len(edges))
+            for start in range(bounds[row], bounds[row + 1], step):
+                points = candidates[start:min(start + step, bounds[row + 1])]
+                py, px = lats[points, None], lons[points, None]
+                spans = (y1 > py) != (y2 > py)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+                crossings = np.count_nonzero(spans & (px < crossing_x), axis=1)
+                inside[points] = crossings % 2 == 1
+        return inside
+
+
+# Nearest-neighbour index over a set of (lat, lon) points, such as the HQs and
+# servers of the topology. Longitudes are scaled by cos(latitude) so distances
+# are close to true ones. Every query is compared with every point, a chunk of
+# queries at a time, which is fast for the few thousand points of a topology.
+class PointIndex:
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.lon_scale = math.cos(math.radians(points[:, 0].mean()))
+        self.xy = np.column_stack([points[:, 1] * self.lon_scale, points[:, 0]])
+        self.norms = (self.xy ** 2).sum(axis=1)
+
+    # Function to find the nearest indexed point of many query points. Returns
+    # the index of the nearest point and its distance in degrees of latitude.
+    # Squared distances are expanded as |q|^2 - 2 q.p + |p|^2 (|q|^2 is the same
+    # for a whole row, so it is left out) so the heavy part is a single matrix
+    # product per chunk.
+    def nearest(self, lats, lons):
+        xy = np.column_stack([np.asarray(lons, dtype=np.float64) * self.lon_scale, np.asarray(lats, dtype=np.float64)])
+        best_index = np.empty(len(xy), dtype=np.int64)
+        step = max(1, CHUNK_SIZE * CHUNK_SIZE // len(self.xy))
+        for start in range(0, len(xy), step):
+            chunk = xy[start:start + step]
+            best_index[start:start + step] = (self.norms[None, :] - 2 * chunk @ self.xy.T).argmin(axis=1)
+        return best_index, np.hypot(*(self.xy[best_index] - xy).T)
+
+
+# Function to draw random points in a square around a centre, keeping only the
+# ones on land. Candidates are drawn and tested in batches.
+def random_points_on_land(land, center, num_points, max_offset_degrees, rng, max_batches=50):
+    found = np.empty((0, 2))
+    batch = max(64, num_points * 2)
+    for _ in range(max_batches):
+        candidates = center + rng.uniform(-max_offset_degrees, max_offset_degrees, size=(batch, 2))
+        found = np.concatenate([found, candidates[land.contains(candidates[:, 0], candidates[:, 1])]])
+        if len(found) >= num_points:
+            break
+    return found[:num_points]
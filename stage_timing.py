@@ -0,0 +1,172 @@
+import bisect
+import contextlib
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the histogram buckets, in seconds (the last bucket is +Inf)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_NAME = "zelonia_stage_seconds"
+
+# Shared by every stage when timing is disabled, so a disabled stage costs one
+# attribute check and an empty `with`
+NO_TIMING = contextlib.nullcontext()
+
+
+# Latency histogram of one stage: a count per bucket plus the sum and maximum
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    # Function to estimate a quantile by interpolating inside the bucket it
+    # falls in, as Prometheus' histogram_quantile does (the maximum past the
+    # last bucket)
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(BUCKETS, self.counts):
+            if count and cumulative + count >= rank:
+                return min(lower + (bound - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+            lower = bound
+        return self.max
+
+
+# Histograms of every stage, e.g. for one session or for the whole process
+class StageTimings:
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    # Function to summarise each stage as a row: calls, mean, p50, p95, max (ms)
+    def summary(self):
+        with self._lock:
+            return [{"Stage": stage, "Calls": h.count, "Mean ms": 1000 * h.total / h.count,
+                     "p50 ms": 1000 * h.quantile(0.5), "p95 ms": 1000 * h.quantile(0.95), "Max ms": 1000 * h.max}
+                    for stage, h in sorted(self.histograms.items())]
+
+    # Function to export the histograms in the Prometheus text format
+    def prometheus_text(self):
+        lines = [f"# HELP {METRIC_NAME} Time spent in each dashboard stage",
+                 f"# TYPE {METRIC_NAME} histogram"]
+        with self._lock:
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {h.total:.6f}')
+                lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+# Times the stages of the dashboard into the process-wide histograms and into
+# those of the session running on the current thread, if one is set
+class StageTimer:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.process = StageTimings()
+        self._local = threading.local()
+
+    # Function to time a block: `with timer.stage("server_map"): ...`
+    def stage(self, name):
+        if not self.enabled:
+            return NO_TIMING
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.process.observe(name, seconds)
+            session = getattr(self._local, "session", None)
+            if session is not None:
+                session.observe(name, seconds)
+
+    # Decorator to time every call of a function. With timing disabled the
+    # function is returned as it is.
+    def timed(self, name):
+        def decorate(function):
+            if not self.enabled:
+                return function
+
+            @functools.wraps(function)
+            def timed_function(*args, **kwargs):
+                with self._timed(name):
+                    return function(*args, **kwargs)
+            return timed_function
+        return decorate
+
+    # Function to record this thread's stages into a session's timings as well
+    @contextlib.contextmanager
+    def session(self, timings):
+        previous = getattr(self._local, "session", None)
+        self._local.session = timings
+        try:
+            yield
+        finally:
+            self._local.session = previous
+
+    # Function to wrap a function for a worker thread so that its stages are
+    # recorded into the session of the thread that wrapped it
+    def bind(self, function):
+        timings = getattr(self._local, "session", None)
+        if not self.enabled or timings is None:
+            return function
+
+        @functools.wraps(function)
+        def bound(*args, **kwargs):
+            with self.session(timings):
+                return function(*args, **kwargs)
+        return bound
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    timings = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404, "Expected /metrics")
+            return
+        data = self.timings.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to serve the timings at /metrics on a background thread; returns the server
+def start_metrics_server(timings, host="0.0.0.0", port=9502):
+    handler = type("ZeloniaMetricsHandler", (MetricsRequestHandler,), {"timings": timings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
@@ -0,0 +1,225 @@
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+
+import numpy as np
+
+METRICS = ["system_health", "active_instances", "resource_utilization", "service_availability"]
+
+# Raw samples kept per metric, enough for one minute at 10 samples per second
+RAW_CAPACITY = 600
+# Downsampled tiers: (bucket width in seconds, number of buckets kept)
+TIERS = {
+    "1 h": (10, 360),
+    "24 h": (300, 288),
+}
+# Window shown by each view, in seconds
+VIEWS = {"1 min": 60, "1 h": 3600, "24 h": 86400}
+
+
+# Fixed-size ring buffer of (time, value) pairs backed by NumPy arrays
+class RingBuffer:
+    __slots__ = ("times", "values", "head", "count")
+
+    def __init__(self, capacity):
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, value):
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    # Function to get the stored samples in time order, oldest first
+    def ordered(self):
+        if self.count < len(self.times):
+            return self.times[:self.count].copy(), self.values[:self.count].copy()
+        return np.roll(self.times, -self.head), np.roll(self.values, -self.head)
+
+
+# One metric of one system: raw samples plus a downsampled ring per tier. Each
+# tier averages the samples of a bucket and stores the mean when it closes.
+class MetricSeries:
+    __slots__ = ("raw", "tiers", "buckets")
+
+    def __init__(self):
+        self.raw = RingBuffer(RAW_CAPACITY)
+        self.tiers = {name: RingBuffer(size) for name, (_, size) in TIERS.items()}
+        # Open bucket per tier: [start time, sum, count]
+        self.buckets = {name: [None, 0.0, 0] for name in TIERS}
+
+    def append(self, timestamp, value):
+        self.raw.append(timestamp, value)
+        for name, (width, _) in TIERS.items():
+            bucket = self.buckets[name]
+            start = timestamp - timestamp % width
+            if bucket[0] is not None and start != bucket[0]:
+                self.tiers[name].append(bucket[0], bucket[1] / bucket[2] if bucket[2] else math.nan)
+                bucket[1], bucket[2] = 0.0, 0
+            bucket[0] = start
+            if not math.isnan(value):
+                bucket[1] += value
+                bucket[2] += 1
+
+    def latest(self):
+        if not len(self.raw):
+            return None
+        return self.raw.values[self.raw.head - 1]
+
+    # Function to get the samples of one view ("1 min", "1 h" or "24 h")
+    def view(self, name, now):
+        times, values = (self.raw if name not in self.tiers else self.tiers[name]).ordered()
+        keep = times >= now - VIEWS[name]
+        return times[keep], values[keep]
+
+
+# Thread-safe store of every metric of the given systems. Samples for any
+# other system or metric (from a bad or hostile feed) are dropped and counted,
+# so the store never holds more than one series per system and metric.
+class TelemetryStore:
+    def __init__(self, system_names):
+        self._series = {}
+        self._accepted = frozenset((system_name, metric) for system_name in system_names for metric in METRICS)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def ingest(self, samples):
+        with self._lock:
+            for timestamp, system_name, metric, value in samples:
+                series = self._series.get((system_name, metric))
+                if series is None:
+                    if (system_name, metric) not in self._accepted:
+                        self.dropped += 1
+                        continue
+                    series = self._series[(system_name, metric)] = MetricSeries()
+                series.append(timestamp, float(value))
+
+    def latest(self, system_name, metric):
+        with self._lock:
+            series = self._series.get((system_name, metric))
+            return None if series is None else series.latest()
+
+    def view(self, system_name, metric, name, now=None):
+        with self._lock:
+            series = self._series.get((system_name, metric))
+            if series is None:
+                return np.zeros(0), np.zeros(0)
+            return series.view(name, time.time() if now is None else now)
+
+    def systems(self):
+        with self._lock:
+            return sorted({system_name for system_name, _ in self._series})
+
+
+# Telemetry sources return the samples that arrived since the last poll as
+# (timestamp, system, metric, value) tuples and must never block.
+
+# Source that invents plausible values from each system's admin status
+class StubSource:
+    def __init__(self, get_statuses):
+        self.get_statuses = get_statuses
+
+    def poll(self):
+        now = time.time()
+        samples = []
+        for system_name, status in self.get_statuses().items():
+            if status == "Online":
+                values = [random.randint(96, 100), random.randint(20, 30),
+                          random.uniform(60, 80), random.uniform(99.5, 99.9)]
+            elif status == "Isolated":
+                values = [math.nan] * 4
+            else:
+                values = [random.randint(0, 2), 0, 0, 0]
+            samples.extend((now, system_name, metric, value) for metric, value in zip(METRICS, values))
+        return samples
+
+
+def parse_sample(line):
+    record = json.loads(line)
+    return (float(record.get("time", time.time())), record["system"], record["metric"], float(record["value"]))
+
+
+# Source that follows a JSON-lines file such as
+#   {"time": 1715241600.0, "system": "Weather", "metric": "system_health", "value": 98}
+class FileSource:
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+        self.partial = ''
+
+    def poll(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            if os.fstat(f.fileno()).st_size < self.position:
+                # The file was truncated or rotated, start over
+                self.position, self.partial = 0, ''
+            f.seek(self.position)
+            data = self.partial + f.read()
+            self.position = f.tell()
+        lines = data.split('\n')
+        self.partial = lines.pop()
+        return [parse_sample(line) for line in lines if line.strip()]
+
+
+# Source that receives the same JSON lines as UDP datagrams
+class SocketSource:
+    def __init__(self, host, port):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+    def poll(self):
+        samples = []
+        while True:
+            try:
+                datagram = self.sock.recv(65536)
+            except BlockingIOError:
+                return samples
+            samples.extend(parse_sample(line) for line in datagram.decode("utf-8").splitlines() if line.strip())
+
+
+# Function to create a source from a spec: "stub", "file:<path>" or "udp:<host>:<port>"
+def create_source(spec, get_statuses):
+    kind, _, target = spec.partition(":")
+    if kind == "stub":
+        return StubSource(get_statuses)
+    elif kind == "file":
+        return FileSource(target)
+    elif kind == "udp":
+        host, _, port = target.rpartition(":")
+        return SocketSource(host or "0.0.0.0", int(port))
+    raise ValueError(f"Unknown telemetry source: {spec}")
+
+
+# Background thread that polls a source and feeds the store
+class TelemetryCollector(threading.Thread):
+    def __init__(self, store, source, interval):
+        super().__init__(daemon=True, name="telemetry-collector")
+        self.store = store
+        self.source = source
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def poll_once(self):
+        self.store.ingest(self.source.poll())
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.poll_once()
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Telemetry poll failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import io
+import math
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from simplify_geojson import iter_geometries, load_boundary
+
+BOUNDARIES = ["Zelonia", "Putonia"]
+DEFAULT_TILE_FILE = "data/tiles.mbtiles"
+# Same basemap the maps use online
+CARTO_DARK_URL = "https://a.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png"
+MIN_ZOOM = 6
+MAX_ZOOM = 12
+TILE_SIZE = 256
+# Tiles cover a bit more than each boundary so the edges don't show
+BOUNDS_MARGIN_DEGREES = 0.2
+# Browsers may keep a tile this long before asking again (and get a 304)
+TILE_MAX_AGE = 7 * 24 * 3600
+MISSING_TILE_MAX_AGE = 300
+# Colours of rendered tiles, close to the dark_matter basemap
+RENDER_BACKGROUND = (14, 14, 14)
+RENDER_LAND = (44, 44, 44)
+RENDER_COAST = (70, 70, 70)
+
+
+# Function to wrap a longitude into [-180, 180). The Zelonia boundary sits
+# past 180 and Leaflet wraps tile columns the same way.
+def wrap_longitude(lon):
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+# Function to get the (x, y) of the tile holding a point, as fractions
+def tile_coordinates(lat, lon, zoom):
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = (wrap_longitude(lon) + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+
+# Function to list the tiles covering a bounding box at one zoom level
+def tiles_for_bounds(bounds, zoom):
+    min_lat, min_lon, max_lat, max_lon = bounds
+    x0, y0 = tile_coordinates(max_lat, min_lon, zoom)
+    x1, y1 = tile_coordinates(min_lat, max_lon, zoom)
+    n = 2 ** zoom
+    columns = range(int(x0), int(x1) + 1) if x0 <= x1 else list(range(int(x0), n)) + list(range(0, int(x1) + 1))
+    return [(zoom, x % n, y) for x in columns for y in range(int(y0), min(int(y1), n - 1) + 1)]
+
+
+# Function to get (min_lat, min_lon, max_lat, max_lon) of a GeoJSON object
+def boundary_bounds(data, margin=BOUNDS_MARGIN_DEGREES):
+    lats, lons = [], []
+    for geometry in iter_geometries(data):
+        for polygon in iter_polygons(geometry):
+            for ring in polygon:
+                lons.extend(c[0] for c in ring)
+                lats.extend(c[1] for c in ring)
+    return min(lats) - margin, min(lons) - margin, max(lats) + margin, max(lons) + margin
+
+
+# Function to get each polygon of a geometry as a list of rings (exterior first)
+def iter_polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        yield geometry['coordinates']
+    elif geometry['type'] == 'MultiPolygon':
+        yield from geometry['coordinates']
+
+
+# Tile store in the MBTiles layout (SQLite; rows are counted from the bottom,
+# as in TMS). Each thread gets its own connection.
+class MBTiles:
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        if not readonly:
+            connection = self.connection()
+            connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+                               "tile_row INTEGER, tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))")
+            connection.commit()
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.readonly:
+                connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+        return connection
+
+    def get(self, zoom, x, y):
+        row = self.connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, 2 ** zoom - 1 - y)).fetchone()
+        return None if row is None else row[0]
+
+    def __contains__(self, tile):
+        zoom, x, y = tile
+        return self.connection().execute(
+            "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, 2 ** zoom - 1 - y)).fetchone() is not None
+
+    def put_many(self, tiles):
+        connection = self.connection()
+        connection.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                               [(zoom, x, 2 ** zoom - 1 - y, data) for (zoom, x, y), data in tiles])
+        connection.commit()
+
+    def set_metadata(self, metadata):
+        connection = self.connection()
+        connection.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                               [(name, str(value)) for name, value in metadata.items()])
+        connection.commit()
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+
+def download_tile(url_template, tile, retries=3):
+    zoom, x, y = tile
+    request = urllib.request.Request(url_template.format(z=zoom, x=x, y=y), headers={"User-Agent": "zelonia-tile-cache"})
+    for attempt in range(retries):
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.read()
+        except (urllib.error.URLError, OSError):
+            if attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+# Renders basemap tiles from the boundary GeoJSONs, for networks that can't
+# reach a tile CDN at all. Each zoom uses the matching simplified boundary.
+class BoundaryRenderer:
+    def __init__(self, names=BOUNDARIES):
+        self.names = names
+        self._polygons = {}
+
+    # Function to get every polygon as rings of global pixel coordinates
+    def polygons(self, zoom):
+        if zoom not in self._polygons:
+            polygons = []
+            for name in self.names:
+                for geometry in iter_geometries(load_boundary(name, zoom)):
+                    for polygon in iter_polygons(geometry):
+                        rings = [[tuple(c * TILE_SIZE for c in tile_coordinates(lat, lon, zoom)) for lon, lat, *_ in ring]
+                                 for ring in polygon]
+                        xs = [x for x, _ in rings[0]]
+                        ys = [y for _, y in rings[0]]
+                        polygons.append(((min(xs), min(ys), max(xs), max(ys)), rings))
+            self._polygons[zoom] = polygons
+        return self._polygons[zoom]
+
+    def render(self, tile):
+        from PIL import Image, ImageDraw
+
+        zoom, x, y = tile
+        left, top = x * TILE_SIZE, y * TILE_SIZE
+        image = Image.new("RGB", (TILE_SIZE, TILE_SIZE), RENDER_BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        for (min_x, min_y, max_x, max_y), rings in self.polygons(zoom):
+            if max_x < left or min_x > left + TILE_SIZE or max_y < top or min_y > top + TILE_SIZE:
+                continue
+            for i, ring in enumerate(rings):
+                points = [(px - left, py - top) for px, py in ring]
+                # Holes are painted back with the background
+                draw.polygon(points, fill=RENDER_LAND if i == 0 else RENDER_BACKGROUND, outline=RENDER_COAST)
+        output = io.BytesIO()
+        image.save(output, format="PNG", optimize=True)
+        return output.getvalue()
+
+
+# Function to fill a tile store with every tile of the boundaries' bounding
+# boxes. Tiles already in the store are skipped, so an interrupted run resumes.
+def prefetch_tiles(store, zoom_levels, url_template=CARTO_DARK_URL, render=False, workers=8, names=BOUNDARIES,
+                   batch_size=64):
+    bounds = [boundary_bounds(load_boundary(name)) for name in names]
+    tiles = sorted({tile for zoom in zoom_levels for box in bounds for tile in tiles_for_bounds(box, zoom)})
+    missing = [tile for tile in tiles if tile not in store]
+    fetch = BoundaryRenderer(names).render if render else lambda tile: download_tile(url_template, tile)
+
+    with ThreadPoolExecutor(max_workers=1 if render else workers) as executor:
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            store.put_many(list(zip(batch, executor.map(fetch, batch))))
+            print(f"{min(start + batch_size, len(missing))}/{len(missing)} tiles")
+
+    store.set_metadata({
+        "name": "Zelonia basemap",
+        "format": "png",
+        "type": "baselayer",
+        "minzoom": min(zoom_levels),
+        "maxzoom": max(zoom_levels),
+        "bounds": ",".join(f"{value:.4f}" for value in (
+            min(b[1] for b in bounds), min(b[0] for b in bounds), max(b[3] for b in bounds), max(b[2] for b in bounds))),
+        "attribution": "Rendered from boundary files" if render else "&copy; OpenStreetMap contributors &copy; CARTO",
+    })
+    return len(tiles), len(missing)
+
+
+# Request handler for /tiles/<z>/<x>/<y>.png. Tiles carry an ETag and a long
+# max-age, so browsers reuse them and revalidate with a cheap 304.
+class TileRequestHandler(BaseHTTPRequestHandler):
+    store = None
+    max_age = TILE_MAX_AGE
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        try:
+            if len(parts) != 4 or parts[0] != "tiles":
+                raise ValueError(self.path)
+            zoom, x, y = int(parts[1]), int(parts[2]), int(parts[3].split(".")[0])
+        except ValueError:
+            self.send_error(400, "Expected /tiles/<z>/<x>/<y>.png")
+            return
+
+        data = self.store.get(zoom, x, y)
+        if data is None:
+            self.send_response(404)
+            self.send_header("Cache-Control", f"public, max-age={MISSING_TILE_MAX_AGE}")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        not_modified = self.headers.get("If-None-Match") == etag
+        self.send_response(304 if not_modified else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"public, max-age={self.max_age}")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if not not_modified:
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if not not_modified:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start serving a tile store on a background thread; returns the server
+def start_tile_server(path, host="0.0.0.0", port=8502, max_age=TILE_MAX_AGE):
+    handler = type("ZeloniaTileHandler", (TileRequestHandler,), {"store": MBTiles(path, readonly=True),
+                                                                  "max_age": max_age})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="tile-server").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch basemap tiles into an MBTiles file, or serve them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prefetch = subparsers.add_parser("prefetch", help="Download or render the tiles around the boundaries")
+    prefetch.add_argument("-o", "--output", default=DEFAULT_TILE_FILE, help="MBTiles file (default: %(default)s)")
+    prefetch.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    prefetch.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    prefetch.add_argument("--url", default=CARTO_DARK_URL, help="Tile URL template (default: %(default)s)")
+    prefetch.add_argument("--render", action="store_true", help="Render tiles from the boundary files instead")
+    prefetch.add_argument("--workers", type=int, default=8, help="Parallel downloads")
+
+    serve = subparsers.add_parser("serve", help="Serve an MBTiles file at /tiles/<z>/<x>/<y>.png")
+    serve.add_argument("input", nargs="?", default=DEFAULT_TILE_FILE)
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args()
+
+    if args.command == "prefetch":
+        start = time.perf_counter()
+        total, fetched = prefetch_tiles(MBTiles(args.output), range(args.min_zoom, args.max_zoom + 1), args.url,
+                                        args.render, args.workers)
+        print(f"{args.output}: {total} tiles ({fetched} new) in {time.perf_counter() - start:.1f}s")
+    else:
+        server = start_tile_server(args.input, args.host, args.port)
+        print(f"Serving {args.input} on http://{args.host}:{args.port}/tiles/{{z}}/{{x}}/{{y}}.png")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+
+TOPOLOGY_FILE = "data/topology.json"
+
+
+def offset_location(location, offset):
+    return (location[0] + offset[0], location[1] + offset[1])
+
+
+# One technical system: its headquarters, its servers and the links from the
+# headquarters to each server. Locations are (lat, lon) tuples on the map.
+class System:
+    __slots__ = ("name", "headquarters", "servers", "links")
+
+    def __init__(self, name, headquarters, servers):
+        self.name = name
+        self.headquarters = headquarters
+        self.servers = servers
+        self.links = tuple((headquarters, server) for server in servers)
+
+
+# Every site on the maps, loaded once and shared read-only by all sessions.
+# Tuples keep it immutable so the maps and panels can use it directly.
+class Topology:
+    __slots__ = ("center", "systems", "by_name", "attack_server", "attack_entry_point", "attack_targets")
+
+    def __init__(self, center, systems, attack_server, attack_entry_point, attack_targets):
+        self.center = center
+        self.systems = systems
+        self.by_name = {system.name: system for system in systems}
+        self.attack_server = attack_server
+        self.attack_entry_point = attack_entry_point
+        # Systems whose headquarters the attack server reaches
+        self.attack_targets = attack_targets
+
+    @property
+    def system_names(self):
+        return [system.name for system in self.systems]
+
+    @property
+    def headquarters(self):
+        return [system.headquarters for system in self.systems]
+
+    def system(self, name):
+        return self.by_name[name]
+
+
+# Function to load the topology file. Coordinates in the file are the real
+# Singapore ones; the Zelonia offset is applied here once.
+def load_topology(path=TOPOLOGY_FILE):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    offset = data["offset"]
+    systems = tuple(
+        System(system["name"], offset_location(system["headquarters"], offset),
+               tuple(offset_location(server, offset) for server in system["servers"]))
+        for system in data["systems"])
+    attack = data["attack"]
+    return Topology(
+        center=offset_location(data["center"], offset),
+        systems=systems,
+        attack_server=offset_location(attack["server"], attack.get("server_offset", offset)),
+        attack_entry_point=offset_location(attack["entry_point"], offset),
+        attack_targets=tuple(attack["targets"]),
+    )